@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+# Mide el costo de arranque de la aplicación:
+#   python -m benchmarks.arranque
+# - importación de notas en un intérprete nuevo (lo que paga el primer usuario)
+# - primera ejecución de notas_escolares.py y cada recarga (lo que paga cada interacción)
+# - tamaño del HTML/CSS incrustado en la página, que se envía en cada recarga
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def importar(modulo, repeticiones):
+    codigo = f'import time; t = time.perf_counter(); import {modulo}; print(time.perf_counter() - t)'
+    tiempos = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, '-c', codigo], cwd=RAIZ, capture_output=True, text=True, check=True)
+        tiempos.append(float(salida.stdout))
+    return tiempos
+
+def ejecuciones(repeticiones):
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join(RAIZ, 'notas_escolares.py'), default_timeout=120)
+    inicio = time.perf_counter()
+    app.run()
+    primera = time.perf_counter() - inicio
+    recargas = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        app.run()
+        recargas.append(time.perf_counter() - inicio)
+    incrustado = sum(len(m.value) for m in app.markdown)
+    return primera, recargas, incrustado
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.arranque', description='Costo de arranque de la aplicación')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args(argv)
+    tiempos = importar('notas', args.repeticiones)
+    print(f'import notas: mediana {statistics.median(tiempos) * 1000:.0f} ms')
+    primera, recargas, incrustado = ejecuciones(args.repeticiones)
+    print(f'primera ejecución de la página: {primera * 1000:.0f} ms')
+    print(f'recarga: mediana {statistics.median(recargas) * 1000:.0f} ms')
+    print(f'HTML incrustado por recarga: {incrustado / 1024:.0f} KB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+from collections import defaultdict
+import numpy as np
+import camelot
+from pypdf import PdfReader
+from notas.notas import (
+    read_data, paginas_con_notas, unir_tablas, preparar_notas, leer_camelot,
+    evaluar, reparar_bytes, buscar_ghostscript, comparar_motores, CONTADORES,
+)
+from notas.texto import leer_tablas_texto
+from notas.lote import procesar_lote
+from notas.cache import CacheExtraccion
+from .sintetico import variantes
+
+# Mide por separado cada etapa del proceso de un certificado:
+#   python -m benchmarks.ejecutar [--corpus carpeta] [--motor texto|camelot|plantilla] [--workers N]
+# Sin --corpus se usa el corpus sintético de benchmarks/sintetico.py. Con --motor plantilla
+# se usa camelot con la caché de plantillas (notas/plantillas.py) y se informa su tasa de aciertos
+
+ETAPAS = ['repair_pdf', 'read_data', 'tablas', 'procesar_tabla', 'preparar_notas', 'reglas']
+
+class Cronometro:
+    def __init__(self):
+        self.tiempos = defaultdict(list)
+
+    def medir(self, etapa, funcion, *args, **kwargs):
+        inicio = time.perf_counter()
+        salida = funcion(*args, **kwargs)
+        self.tiempos[etapa].append(time.perf_counter() - inicio)
+        return salida
+
+    def resumen(self):
+        filas = []
+        for etapa in ETAPAS + sorted(set(self.tiempos) - set(ETAPAS)):
+            t = np.array(self.tiempos.get(etapa, [])) * 1000
+            if not len(t):
+                continue
+            filas.append({
+                'etapa': etapa,
+                'n': len(t),
+                'p50_ms': float(np.percentile(t, 50)),
+                'p90_ms': float(np.percentile(t, 90)),
+                'p99_ms': float(np.percentile(t, 99)),
+                'max_ms': float(t.max()),
+                'total_s': float(t.sum() / 1000),
+            })
+        return filas
+
+def leer_corpus(carpeta):
+    for raiz, _, archivos in sorted(os.walk(carpeta)):
+        for nombre in sorted(archivos):
+            if nombre.lower().endswith('.pdf'):
+                with open(os.path.join(raiz, nombre), 'rb') as f:
+                    yield nombre, f.read()
+
+def procesar_uno(crono, datos, motor, reparar):
+    if reparar:
+        datos = crono.medir('repair_pdf', reparar_bytes, datos)
+    reader = crono.medir('read_data', PdfReader, io.BytesIO(datos), strict=True)
+    dni, nombre, documento = crono.medir('read_data', read_data, reader)
+    paginas = crono.medir('read_data', paginas_con_notas, reader)
+    if motor == 'plantilla':
+        # leer_camelot ya devuelve las tablas unidas
+        res = crono.medir('tablas', leer_camelot, io.BytesIO(datos), paginas, len(reader.pages), documento)
+    else:
+        if motor == 'camelot':
+            pages = ','.join(map(str, paginas)) if paginas else 'all'
+            tablas = crono.medir('tablas', camelot.read_pdf, io.BytesIO(datos), pages=pages, strip_text='\n')
+            tablas = [t.df for t in tablas]
+        else:
+            tablas = crono.medir('tablas', leer_tablas_texto, io.BytesIO(datos), paginas)
+        res = crono.medir('procesar_tabla', unir_tablas, tablas)
+    extraccion = crono.medir('preparar_notas', preparar_notas, dni, nombre, documento, res)
+    return crono.medir('reglas', evaluar, extraccion, 72, 'MEDICINA')
+
+def imprimir(filas, archivos, segundos, rss_mb):
+    print(f"{'etapa':<16}{'n':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'total s':>10}")
+    for f in filas:
+        print(f"{f['etapa']:<16}{f['n']:>6}{f['p50_ms']:>10.1f}{f['p90_ms']:>10.1f}{f['p99_ms']:>10.1f}{f['max_ms']:>10.1f}{f['total_s']:>10.2f}")
+    print(f'{archivos} archivos en {segundos:.2f} s: {archivos / segundos:.2f} archivos/s')
+    print(f'RSS máximo: {rss_mb:.0f} MB')
+
+def rss_maximo_mb():
+    # En Linux ru_maxrss está en KB; incluye a los procesos hijos ya terminados
+    propio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    hijos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(propio, hijos) / 1024
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.ejecutar', description='Benchmark del proceso de certificados')
+    parser.add_argument('--corpus', help='Carpeta con PDF propios en lugar del corpus sintético')
+    parser.add_argument('--repeticiones', type=int, default=1, help='Veces que se repite el corpus sintético')
+    parser.add_argument('--motor', choices=['texto', 'camelot', 'plantilla'], default='texto')
+    parser.add_argument('--reparar', action='store_true', help='Medir también la reparación con Ghostscript')
+    parser.add_argument('--workers', type=int, default=0, help='Medir además el rendimiento de procesar_lote con N procesos')
+    parser.add_argument('--validar', action='store_true', help='Comparar la extracción de camelot y del motor de texto')
+    parser.add_argument('--guardar', help='Carpeta donde escribir el corpus sintético generado')
+    parser.add_argument('--json', help='Archivo donde guardar el resumen en JSON')
+    args = parser.parse_args(argv)
+
+    corpus = list(leer_corpus(args.corpus) if args.corpus else variantes(args.repeticiones))
+    if args.guardar:
+        os.makedirs(args.guardar, exist_ok=True)
+        for nombre, datos in corpus:
+            with open(os.path.join(args.guardar, nombre), 'wb') as f:
+                f.write(datos)
+    if args.reparar:
+        try:
+            buscar_ghostscript()
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            args.reparar = False
+
+    crono = Cronometro()
+    errores = 0
+    inicio = time.perf_counter()
+    for nombre, datos in corpus:
+        try:
+            procesar_uno(crono, datos, args.motor, args.reparar)
+        except Exception as e:
+            errores += 1
+            print(f'{nombre}: {e}', file=sys.stderr)
+    segundos = time.perf_counter() - inicio
+
+    # read_data se midió en tres llamadas por archivo: se suman de a tres
+    lecturas = crono.tiempos['read_data']
+    crono.tiempos['read_data'] = [sum(lecturas[i:i + 3]) for i in range(0, len(lecturas), 3)]
+    filas = crono.resumen()
+    resumen = {
+        'archivos': len(corpus),
+        'errores': errores,
+        'motor': args.motor,
+        'segundos': segundos,
+        'archivos_por_segundo': len(corpus) / segundos,
+        'etapas': filas,
+    }
+    imprimir(filas, len(corpus), segundos, rss_maximo_mb())
+    if args.motor == 'plantilla':
+        plantillas = {k: CONTADORES[f'plantilla_{k}'] for k in ['acierto', 'nueva', 'descartada']}
+        resumen['plantillas'] = plantillas
+        print(f"plantillas: {plantillas['acierto']} aciertos de {sum(plantillas.values())} "
+              f"({plantillas['nueva']} nuevas, {plantillas['descartada']} descartadas)")
+
+    if args.workers:
+        # Extracción en paralelo sin caché previa (directorio temporal vacío)
+        with tempfile.TemporaryDirectory() as directorio:
+            inicio = time.perf_counter()
+            for _ in procesar_lote(corpus, 72, 'MEDICINA', max_workers=args.workers, cache=CacheExtraccion(directorio)):
+                pass
+            segundos = time.perf_counter() - inicio
+        resumen['lote'] = {'workers': args.workers, 'segundos': segundos, 'archivos_por_segundo': len(corpus) / segundos}
+        print(f'procesar_lote con {args.workers} procesos: {len(corpus) / segundos:.2f} archivos/s')
+
+    # Con --validar el código de salida es 1 si algún archivo no se pudo comparar o tiene
+    # diferencias: solo 0 indica que los motores coinciden en todo el corpus
+    codigo = 0
+    if args.validar:
+        diferencias = fallidos = 0
+        for nombre, datos in corpus:
+            try:
+                d = comparar_motores(datos)
+            except Exception as e:
+                fallidos += 1
+                print(f'{nombre}: no se pudo comparar: {e}', file=sys.stderr)
+                continue
+            if not d.empty:
+                diferencias += 1
+                print(f'{nombre}: {len(d)} filas distintas entre motores', file=sys.stderr)
+        resumen['archivos_con_diferencias'] = diferencias
+        resumen['archivos_sin_comparar'] = fallidos
+        print(f'{len(corpus) - fallidos} archivo(s) comparados: {diferencias} con diferencias entre '
+              f'camelot y el motor de texto, {fallidos} no se pudieron comparar')
+        if diferencias or fallidos:
+            codigo = 1
+
+    resumen['rss_max_mb'] = rss_maximo_mb()
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resumen, f, indent=2, ensure_ascii=False)
+    return codigo
+
+if __name__ == '__main__':
+    sys.exit(main())
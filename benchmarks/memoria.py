@@ -0,0 +1,28 @@
+import io
+import argparse
+import pandas as pd
+from notas.notas import procesar_pdf
+from notas.compacto import reporte_memoria
+from .sintetico import variantes
+
+# Memoria de la tabla de notas por cada 1000 estudiantes, original y compactada:
+#   python -m benchmarks.memoria [--estudiantes 1000]
+# Se extrae una vez cada variante del corpus sintético y se repite con otros DNI
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.memoria', description='Memoria de la tabla de notas compactada')
+    parser.add_argument('--estudiantes', type=int, default=1000)
+    args = parser.parse_args(argv)
+    extraidas = [procesar_pdf(io.BytesIO(datos), motor='texto')[3] for _, datos in variantes()]
+    tablas = []
+    for n in range(args.estudiantes):
+        df = extraidas[n % len(extraidas)].copy()
+        df['DNI'] = f'{10000000 + n:08d}'
+        tablas.append(df)
+    reporte = reporte_memoria(pd.concat(tablas, ignore_index=True))
+    print(f'{args.estudiantes} estudiantes')
+    reporte[['original', 'compacto']] /= 1024 * 1024
+    print(reporte.rename(columns={'original': 'original MB', 'compacto': 'compacto MB'}).round(3).to_string())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+import random
+import textwrap
+
+# Genera certificados COE/CLA sintéticos con el mismo tipo de tabla con bordes
+# que emite MINEDU, sin depender de bibliotecas externas.
+
+ANCHO, ALTO = 595, 842
+MARGEN = 15
+COLUMNAS = [110, 90, 185, 36, 36, 36, 36, 36]
+TAM = 6
+INTERLINEA = 7
+
+AREAS = [
+    ('DESARROLLO PERSONAL, CIUDADANÍA Y CÍVICA', [
+        'Construye su identidad',
+        'Convive y participa democráticamente en la búsqueda del bien común',
+    ]),
+    ('CIENCIAS SOCIALES', [
+        'Construye interpretaciones históricas',
+        'Gestiona responsablemente el espacio y el ambiente',
+        'Gestiona responsablemente los recursos económicos',
+    ]),
+    ('EDUCACIÓN PARA EL TRABAJO', [
+        'Gestiona proyectos de emprendimiento económico o social',
+    ]),
+    ('EDUCACIÓN FÍSICA', [
+        'Se desenvuelve de manera autónoma a través de su motricidad',
+        'Asume una vida saludable',
+        'Interactúa a través de sus habilidades sociomotrices',
+    ]),
+    ('COMUNICACIÓN', [
+        'Se comunica oralmente en su lengua materna',
+        'Lee diversos tipos de textos escritos en su lengua materna',
+        'Escribe diversos tipos de textos en su lengua materna',
+    ]),
+    ('ARTE Y CULTURA', [
+        'Aprecia de manera crítica manifestaciones artístico-culturales',
+        'Crea proyectos desde los lenguajes artísticos',
+    ]),
+    ('INGLÉS COMO LENGUA EXTRANJERA', [
+        'Se comunica oralmente en inglés como lengua extranjera',
+        'Lee diversos tipos de textos escritos en inglés como lengua extranjera',
+        'Escribe diversos tipos de textos en inglés como lengua extranjera',
+    ]),
+    ('MATEMÁTICA', [
+        'Resuelve problemas de cantidad',
+        'Resuelve problemas de regularidad, equivalencia y cambio',
+        'Resuelve problemas de forma, movimiento y localización',
+        'Resuelve problemas de gestión de datos e incertidumbre',
+    ]),
+    ('CIENCIA Y TECNOLOGÍA', [
+        'Indaga mediante métodos científicos para construir sus conocimientos',
+        'Explica el mundo físico basándose en conocimientos sobre los seres vivos, materia y energía, biodiversidad, Tierra y universo',
+        'Diseña y construye soluciones tecnológicas para resolver problemas de su entorno',
+    ]),
+    ('EDUCACIÓN RELIGIOSA', [
+        'Construye su identidad como persona humana, amada por Dios, digna, libre y trascendente, comprendiendo la doctrina de su propia religión, abierto al diálogo con las que le son cercanas',
+    ]),
+]
+
+def _escapar(texto):
+    datos = texto.encode('cp1252', errors='replace')
+    return datos.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+class _Pagina:
+    def __init__(self):
+        self.ops = []
+
+    def texto(self, x, y, texto, tam=TAM):
+        self.ops.append(b'BT /F1 %d Tf %.2f %.2f Td (' % (tam, x, y) + _escapar(texto) + b') Tj ET')
+
+    def rect(self, x, y, w, h):
+        self.ops.append(b'%.2f %.2f %.2f %.2f re S' % (x, y, w, h))
+
+    def contenido(self):
+        return b'0.5 w\n' + b'\n'.join(self.ops)
+
+def _pdf(paginas):
+    objetos = []
+
+    def agregar(contenido):
+        objetos.append(contenido)
+        return len(objetos)
+
+    fuente = agregar(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    raiz_paginas = len(objetos) + len(paginas) * 2 + 1
+    hijos = []
+    for pagina in paginas:
+        flujo = pagina.contenido()
+        contenido = agregar(b'<< /Length %d >>\nstream\n' % len(flujo) + flujo + b'\nendstream')
+        hijos.append(agregar(
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] ' % (raiz_paginas, ANCHO, ALTO)
+            + b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>' % (fuente, contenido)
+        ))
+    kids = b' '.join(b'%d 0 R' % h for h in hijos)
+    agregar(b'<< /Type /Pages /Kids [' + kids + b'] /Count %d >>' % len(hijos))
+    catalogo = agregar(b'<< /Type /Catalog /Pages %d 0 R >>' % raiz_paginas)
+
+    salida = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    posiciones = []
+    for n, contenido in enumerate(objetos, start=1):
+        posiciones.append(len(salida))
+        salida += b'%d 0 obj\n' % n + contenido + b'\nendobj\n'
+    xref = len(salida)
+    salida += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objetos) + 1)
+    for p in posiciones:
+        salida += b'%010d 00000 n \n' % p
+    salida += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objetos) + 1, catalogo, xref)
+    return bytes(salida)
+
+def _lineas(texto, ancho):
+    return textwrap.wrap(texto, max(1, int(ancho / (TAM * 0.5)))) or ['']
+
+def _notas(rng, letras, competencias):
+    if letras:
+        return [rng.choices(['AD', 'A', 'B', 'C'], weights=[3, 5, 2, 1])[0] for _ in competencias]
+    return [str(rng.randint(11, 20))]
+
+def generar_certificado(dni='12345678', nombre='ESTUDIANTE DE PRUEBA', tipo='COE', letras=False,
+                        grados=5, colegios=1, anio_fin=2024, max_bloques=None, firmas=False, seed=0):
+    rng = random.Random(seed)
+    xs = [MARGEN]
+    for w in COLUMNAS:
+        xs.append(xs[-1] + w)
+
+    anios = [str(anio_fin - grados + g) if g <= grados else '-' for g in range(1, 6)]
+    grados_txt = [f'{g}.°' for g in range(1, 6)]
+    codmods = []
+    for g in range(1, 6):
+        if g > grados:
+            codmods.append('-')
+        elif colegios > 1 and g >= 3:
+            codmods.append('7654321')
+        else:
+            codmods.append('0123456')
+
+    # Bloques del cuerpo: un área con sus filas (competencia, notas por grado)
+    bloques = []
+    for desc, comps in AREAS:
+        notas = [_notas(rng, letras, comps) if g <= grados else None for g in range(1, 6)]
+        if letras:
+            filas = [(comp, [n[k] if n else '-' for n in notas]) for k, comp in enumerate(comps)]
+        else:
+            filas = [('', [n[0] if n else '-' for n in notas])]
+        bloques.append((desc, filas))
+    bloques.append(('COMPORTAMIENTO', [('', [rng.choice(['AD', 'A', 'B']) if g <= grados else '-' for g in range(1, 6)])]))
+
+    paginas = []
+    pagina = _Pagina()
+    y = ALTO - 40
+    if tipo == 'COE':
+        pagina.texto(MARGEN, y, 'CERTIFICADO OFICIAL DE ESTUDIOS', 12)
+        y -= 20
+        pagina.texto(MARGEN, y, f'Que {nombre}, con DNI N.° {dni}, ha cursado los estudios que se indican:', 8)
+    else:
+        pagina.texto(MARGEN, y, 'CONSTANCIA DE LOGROS DE APRENDIZAJE', 12)
+        y -= 20
+        pagina.texto(MARGEN, y, f'Se deja constancia que el estudiante {nombre}, con DNI del estudiante N.° {dni}, obtuvo:', 8)
+    y -= 20
+
+    def celda(pagina, x0, x1, y0, h, texto):
+        pagina.rect(x0, y0 - h, x1 - x0, h)
+        for k, linea in enumerate(_lineas(texto, x1 - x0 - 4) if texto else []):
+            pagina.texto(x0 + 2, y0 - INTERLINEA * (k + 1), linea)
+
+    def encabezado(pagina, y):
+        h = INTERLINEA + 4
+        for etiqueta, valores in (('Año lectivo:', anios), ('Grado:', grados_txt), ('Código modular de la IE:', codmods)):
+            celda(pagina, xs[0], xs[3], y, h, etiqueta)
+            for c, v in enumerate(valores):
+                celda(pagina, xs[3 + c], xs[4 + c], y, h, v)
+            y -= h
+        return y
+
+    def cerrar_tipo(pagina, inicio, y):
+        celda(pagina, xs[0], xs[1], inicio, inicio - y, 'Áreas Curriculares y Competencias')
+
+    y = encabezado(pagina, y)
+    inicio = y
+    en_pagina = 0
+    for desc, filas in bloques:
+        altos = [max(1, len(_lineas(comp, COLUMNAS[2] - 4))) * INTERLINEA + 4 for comp, _ in filas]
+        ancho_desc = xs[2] if filas[0][0] else xs[3]
+        minimo = len(_lineas(desc, ancho_desc - xs[1] - 4)) * INTERLINEA + 4
+        if sum(altos) < minimo:
+            altos[-1] += minimo - sum(altos)
+        if y - sum(altos) < 90 or (max_bloques and en_pagina >= max_bloques):
+            # La tabla continúa en la página siguiente con el encabezado repetido
+            cerrar_tipo(pagina, inicio, y)
+            paginas.append(pagina)
+            pagina = _Pagina()
+            y = encabezado(pagina, ALTO - 40)
+            inicio = y
+            en_pagina = 0
+        celda(pagina, xs[1], ancho_desc, y, sum(altos), desc)
+        for (comp, notas), h in zip(filas, altos):
+            if comp:
+                celda(pagina, xs[2], xs[3], y, h, comp)
+            for c, nota in enumerate(notas):
+                celda(pagina, xs[3 + c], xs[4 + c], y, h, nota)
+            y -= h
+        en_pagina += 1
+    cerrar_tipo(pagina, inicio, y)
+
+    h = INTERLINEA + 4
+    celda(pagina, xs[0], xs[3], y, h, 'Situación final')
+    for c in range(5):
+        celda(pagina, xs[3 + c], xs[4 + c], y, h, 'PROMOVIDO' if c < grados else '')
+    y -= h + 20
+
+    # Leyenda al pie, que el proceso descarta
+    pagina.rect(xs[0], y - 2 * h, xs[-1] - xs[0], 2 * h)
+    pagina.texto(xs[0] + 2, y - INTERLINEA, '* Este documento ha sido generado para pruebas de rendimiento.')
+    pagina.texto(xs[0] + 2, y - 2 * INTERLINEA, 'AD: Logro destacado  A: Logro esperado  B: En proceso  C: En inicio')
+    paginas.append(pagina)
+    if firmas:
+        # Página final sin tabla de notas, como la de firmas y sellos
+        pagina = _Pagina()
+        pagina.texto(MARGEN, ALTO - 60, 'Lugar y fecha de emisión: Lima, 15 de marzo de 2025', 8)
+        pagina.rect(MARGEN + 60, ALTO - 200, 150, 60)
+        pagina.texto(MARGEN + 80, ALTO - 215, 'Firma y sello del director(a)', 8)
+        paginas.append(pagina)
+    return _pdf(paginas)
+
+def variantes(repeticiones=1):
+    # Combinaciones del corpus: notas numéricas y literales, uno o dos colegios,
+    # 4 o 5 grados, tabla en una página o partida en varias, COE y CLA
+    n = 0
+    for _ in range(repeticiones):
+        for letras in (False, True):
+            for colegios in (1, 2):
+                for grados in (4, 5):
+                    for max_bloques in (None, 4):
+                        for tipo in ('COE', 'CLA'):
+                            n += 1
+                            nombre = '{}-{}-{}col-{}g{}-{:04d}.pdf'.format(
+                                tipo, 'letras' if letras else 'numeros', colegios, grados,
+                                '-paginado' if max_bloques else '', n
+                            )
+                            yield nombre, generar_certificado(
+                                dni=f'{70000000 + n:08d}', nombre=f'ESTUDIANTE {n}', tipo=tipo, letras=letras,
+                                grados=grados, colegios=colegios, max_bloques=max_bloques,
+                                firmas=n % 2 == 0, seed=n
+                            )
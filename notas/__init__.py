@@ -1 +1,7 @@
-from .notas import *
\ No newline at end of file
+from .notas import *
+from .lote import procesar_lote
+from .resultados import Resultados
+from .trabajos import ColaTrabajos
+from .almacen import Almacen
+from .grafo import GrafoResultados
+from .duplicados import Deduplicador
@@ -0,0 +1,103 @@
+import os
+import time
+import sqlite3
+import pandas as pd
+from .cache import CACHE_DIR
+from .notas import COLUMNAS_RESULTADO
+
+# Almacén persistente de los certificados evaluados: resultados, notas, promedios por área,
+# cantidades de notas literales y periodos, indexados por DNI y por el hash del PDF, para
+# consultar a cualquier postulante ya evaluado sin volver a cargar su archivo.
+ALMACEN_DB = os.environ.get('NOTAS_ALMACEN_DB', os.path.join(CACHE_DIR, 'almacen.sqlite3'))
+
+# Columnas de cada tabla, con los mismos nombres que las tablas de Resultados
+TABLAS = {
+    'results': COLUMNAS_RESULTADO + ['Carrera'],
+    'data': ['DNI', 'DOCUMENTO', 'TIPO', 'DESC', 'COMP', 'AÑO', 'GRADO', 'CODMOD', 'NOTA'],
+    'counts': ['DNI', 'NOTA', 'Cantidad'],
+    'promedios': ['DNI', 'GRADO', 'DESC', 'NOTA'],
+    'periodos': ['DNI', 'PERIODO EVALUACIÓN', 'PROMEDIO FINAL', 'PORCENTAJE CON NOTAS AD Y A', 'ESTADO'],
+}
+
+def _columnas(columnas):
+    return ', '.join(f'"{c}"' for c in columnas)
+
+def _filas(df, columnas):
+    # sqlite3 no acepta tipos de numpy ni NaN: se pasan a tipos de Python y None
+    # (infer_objects: una columna object con escalares de numpy pasa a su tipo y de ahí a Python)
+    df = df.reindex(columns=columnas).infer_objects().astype(object)
+    return df.where(df.notna(), None).values.tolist()
+
+class Almacen:
+
+    def __init__(self, ruta=ALMACEN_DB):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            for tabla, columnas in TABLAS.items():
+                clave = 'clave TEXT PRIMARY KEY' if tabla == 'results' else 'clave TEXT NOT NULL'
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {tabla} ({clave}, {_columnas(columnas)}, actualizado REAL)')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {tabla}_dni ON {tabla} ("DNI")')
+                if tabla != 'results':
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS {tabla}_clave ON {tabla} (clave)')
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    def _reemplazar(self, conn, clave, frames, ahora):
+        for tabla, df in frames.items():
+            columnas = TABLAS[tabla]
+            conn.execute(f'DELETE FROM {tabla} WHERE clave = ?', (clave,))
+            conn.executemany(
+                f'INSERT INTO {tabla} (clave, {_columnas(columnas)}, actualizado) '
+                f'VALUES (?, {", ".join("?" * len(columnas))}, ?)',
+                [[clave, *fila, ahora] for fila in _filas(df, columnas)]
+            )
+
+    def guardar(self, clave, salida, carrera):
+        # salida: lo que devuelve evaluar(); reemplaza lo guardado antes para el mismo PDF
+        result, data, counts, notaR, periodos, _ = salida
+        frames = {
+            'results': result.to_frame().T.assign(Carrera=carrera),
+            'data': data,
+            'counts': counts,
+            'promedios': notaR,
+            'periodos': periodos,
+        }
+        with self._conectar() as conn:
+            self._reemplazar(conn, clave, frames, time.time())
+
+    def guardar_decisiones(self, decisiones, carrera):
+        # decisiones: (clave, resultado, periodos) de PDF ya guardados, reevaluados con otro
+        # minADA o carrera; las notas, cantidades y promedios no cambian y no se reescriben
+        ahora = time.time()
+        with self._conectar() as conn:
+            for clave, result, periodos in decisiones:
+                frames = {'results': result.to_frame().T.assign(Carrera=carrera), 'periodos': periodos}
+                self._reemplazar(conn, clave, frames, ahora)
+
+    def _consultar(self, campo, valor):
+        with self._conectar() as conn:
+            return {
+                tabla: pd.read_sql_query(
+                    f'SELECT {_columnas(columnas)} FROM {tabla} WHERE {campo} = ? ORDER BY actualizado, rowid',
+                    conn, params=(valor,)
+                )
+                for tabla, columnas in TABLAS.items()
+            }
+
+    def consultar_dni(self, dni):
+        # Devuelve {tabla: DataFrame} con todas las evaluaciones guardadas del DNI
+        return self._consultar('"DNI"', dni)
+
+    def consultar_clave(self, clave):
+        return self._consultar('clave', clave)
+
+    def dnis(self):
+        with self._conectar() as conn:
+            return [dni for dni, in conn.execute('SELECT DISTINCT "DNI" FROM results ORDER BY "DNI"')]
+
+    def __len__(self):
+        with self._conectar() as conn:
+            return conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
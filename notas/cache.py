@@ -0,0 +1,139 @@
+import os
+import io
+import json
+import hashlib
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .notas import procesar_pdf, MOTOR, VERSION_EXTRACCION
+from .metricas import medir
+from .compacto import compactar, expandir
+
+# Ubicación y tamaño máximo de la caché (se pueden fijar con variables de entorno)
+CACHE_DIR = os.environ.get('NOTAS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'notas'))
+CACHE_MB = int(os.environ.get('NOTAS_CACHE_MB', 512))
+
+def hash_pdf(datos):
+    return hashlib.sha256(datos).hexdigest()
+
+# Cada cuántas escrituras se vuelve a medir el directorio, por los archivos que agregan
+# otros procesos que comparten la caché
+PODA_CADA = 200
+
+class CacheExtraccion:
+    # Guarda la salida de procesar_pdf en Parquet, indexada por el SHA-256 del PDF.
+    # El nombre del archivo incluye además el motor y la versión de la extracción: lo extraído
+    # con otro motor o con una versión anterior no se devuelve (y sale por la política LRU).
+    # Las reglas (minADA, carrera) no forman parte de la clave: se recalculan encima.
+    # La tabla se guarda compactada (categorías, enteros pequeños) y se expande al leerla.
+
+    def __init__(self, directorio=CACHE_DIR, max_mb=CACHE_MB, motor=None):
+        self.directorio = directorio
+        self.max_bytes = max_mb * 1024 * 1024
+        self.motor = motor or MOTOR
+        self.etiqueta = f'{self.motor}-v{VERSION_EXTRACCION}'
+        # Tamaño total estimado: se mide el directorio al escribir por primera vez y luego
+        # solo al superar el límite o cada PODA_CADA escrituras
+        self._total = None
+        self._escrituras = 0
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f'{clave}-{self.etiqueta}.parquet')
+
+    def obtener(self, clave):
+        ruta = self._ruta(clave)
+        try:
+            with medir('cache_lectura'):
+                tabla = pq.read_table(ruta)
+            # Marcar como usado recientemente para la política LRU
+            os.utime(ruta)
+        except (FileNotFoundError, OSError, pa.ArrowInvalid):
+            return None
+        meta = json.loads(tabla.schema.metadata[b'notas'])
+        df = tabla.to_pandas() if meta['dni_valido'] else None
+        if df is not None and meta.get('compacto'):
+            df = expandir(df)
+        return meta['dni'], meta['nombre'], meta['documento'], df, meta['grado_maximo']
+
+    def guardar(self, clave, extraccion):
+        dni, nombre, documento, df, grado_maximo = extraccion
+        meta = {
+            'dni': dni,
+            'nombre': nombre,
+            'documento': documento,
+            'grado_maximo': None if grado_maximo is None else int(grado_maximo),
+            'dni_valido': df is not None,
+            'compacto': df is not None,
+        }
+        tabla = pa.Table.from_pandas(compactar(df) if df is not None else pd.DataFrame())
+        tabla = tabla.replace_schema_metadata({
+            **(tabla.schema.metadata or {}),
+            b'notas': json.dumps(meta).encode(),
+        })
+        # Escritura atómica: varios procesos pueden compartir el mismo directorio
+        fd, tmp = tempfile.mkstemp(dir=self.directorio, suffix='.tmp')
+        os.close(fd)
+        ruta = self._ruta(clave)
+        try:
+            with medir('cache_escritura'):
+                pq.write_table(tabla, tmp, compression='zstd')
+            tam = os.path.getsize(tmp)
+            try:
+                anterior = os.path.getsize(ruta)
+            except FileNotFoundError:
+                anterior = 0
+            os.replace(tmp, ruta)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._escrituras += 1
+        if self._total is None or self._escrituras % PODA_CADA == 0:
+            self._podar()
+        else:
+            self._total += tam - anterior
+            if self._total > self.max_bytes:
+                self._podar()
+
+    def _podar(self):
+        # Mide el directorio y, si supera el límite, lo deja en el 90 % para no tener que
+        # volver a medirlo en cada escritura
+        archivos = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith('.parquet'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directorio, nombre))
+            except FileNotFoundError:
+                continue
+            archivos.append((st.st_mtime, st.st_size, nombre))
+        total = sum(a[1] for a in archivos)
+        if total > self.max_bytes:
+            # Eliminar los menos usados recientemente hasta quedar bajo el límite
+            for _, tam, nombre in sorted(archivos):
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(os.path.join(self.directorio, nombre))
+                except FileNotFoundError:
+                    pass
+                total -= tam
+        self._total = total
+
+    def extraer(self, datos, pwd=None):
+        clave = hash_pdf(datos)
+        extraccion = self.obtener(clave)
+        if extraccion is None:
+            with medir('procesar_pdf'):
+                extraccion = procesar_pdf(io.BytesIO(datos), pwd=pwd, motor=self.motor)
+            self.guardar(clave, extraccion)
+        return extraccion
+
+_cache = None
+
+def cache_por_defecto():
+    global _cache
+    if _cache is None:
+        _cache = CacheExtraccion()
+    return _cache
@@ -0,0 +1,226 @@
+import os
+import sys
+import time
+import zipfile
+import argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .cache import hash_pdf
+from .duplicados import Deduplicador
+from .exportar import formatear, esquema, exportar_excel
+from .lote import procesar_lote, Trabajadores, MAX_WORKERS
+from .notas import CONTADORES, REGLAS
+from . import metricas
+
+# Además de las modalidades de reglas.toml por su nombre
+CARRERAS = {
+    'MEDICINA': 'MEDICINA',
+    'OTRAS': REGLAS.por_defecto,
+    **{modalidad: modalidad for modalidad in REGLAS.modalidades.index},
+}
+
+# Columnas de cada salida; son fijas para que los archivos Parquet de distintos
+# bloques y ejecuciones tengan el mismo esquema
+COLUMNAS = {
+    'Resultado': ['DNI', 'Nombre', 'Tipo', 'Excepcion', 'Prom1a4', 'Prom1a5', 'AD', 'A', 'B', 'C', 'Documento', 'MinADyA', 'Archivo'],
+    'Periodos': ['DNI', 'PERIODO EVALUACIÓN', 'PROMEDIO FINAL', 'PORCENTAJE CON NOTAS AD Y A', 'ESTADO'],
+    'Notas': ['DNI', 'DOCUMENTO', 'TIPO', 'DESC', 'COMP', 'AÑO', 'GRADO', 'CODMOD', 'NOTA'],
+    'Errores': ['Archivo', 'Error'],
+    'Duplicados': ['Archivo', 'Original', 'Motivo'],
+}
+
+def leer_archivo(ruta):
+    with open(ruta, 'rb') as f:
+        return f.read()
+
+def listar_pdfs(entrada):
+    # Devuelve pares (nombre, función que lee los bytes) sin cargar todos los archivos. La
+    # función se debe llamar antes de pedir el siguiente par: el ZIP se cierra al terminar
+    if zipfile.is_zipfile(entrada):
+        with zipfile.ZipFile(entrada) as zf:
+            for nombre in sorted(zf.namelist()):
+                if nombre.lower().endswith('.pdf'):
+                    yield nombre, lambda nombre=nombre: zf.read(nombre)
+        return
+    for raiz, _, archivos in sorted(os.walk(entrada)):
+        for nombre in sorted(archivos):
+            if nombre.lower().endswith('.pdf'):
+                ruta = os.path.join(raiz, nombre)
+                yield os.path.relpath(ruta, entrada), lambda ruta=ruta: leer_archivo(ruta)
+
+class Salidas:
+    # Escribe cada bloque procesado en CSV (agregando filas) y en un Parquet por bloque,
+    # y registra los hashes procesados bien (con la huella de su primera página) en el
+    # checkpoint para poder reanudar; los que fallaron no se registran y se reintentan al
+    # reanudar. procesados son solo los hashes de las ejecuciones anteriores: los de esta
+    # ejecución los revisa el Deduplicador
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+        self.checkpoint = os.path.join(directorio, 'procesados.txt')
+        self.procesados = set()
+        self.previos = []
+        if os.path.exists(self.checkpoint):
+            with open(self.checkpoint, encoding='utf-8') as f:
+                for linea in f:
+                    if linea.strip():
+                        clave, nombre, huella = (linea.rstrip('\n').split('\t') + [''])[:3]
+                        self.procesados.add(clave)
+                        self.previos.append((clave, nombre, huella or None))
+        self.ejecucion = time.strftime('%Y%m%d-%H%M%S')
+        self.bloque = 0
+
+    def escribir(self, frames, hechos):
+        self.bloque += 1
+        for tabla, filas in frames.items():
+            df = formatear(pd.concat(filas, ignore_index=True) if filas else pd.DataFrame(), COLUMNAS[tabla])
+            if df.empty:
+                continue
+            csv = os.path.join(self.directorio, f'{tabla}.csv')
+            df.to_csv(csv, mode='a', header=not os.path.exists(csv), index=False)
+            carpeta = os.path.join(self.directorio, 'parquet', tabla)
+            os.makedirs(carpeta, exist_ok=True)
+            pq.write_table(
+                pa.Table.from_pandas(df, schema=esquema(df.columns), preserve_index=False),
+                os.path.join(carpeta, f'{self.ejecucion}-{self.bloque:05d}.parquet')
+            )
+        # El checkpoint se actualiza después de escribir las salidas del bloque
+        self._marcar(hechos)
+
+    def _marcar(self, hechos):
+        with open(self.checkpoint, 'a', encoding='utf-8') as f:
+            for clave, nombre, huella in hechos:
+                f.write(f'{clave}\t{nombre}\t{huella or ""}\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def duplicados(self, reporte, hechos):
+        # Los duplicados también van al checkpoint: al reanudar no se vuelven a informar
+        if reporte.empty:
+            return
+        csv = os.path.join(self.directorio, 'Duplicados.csv')
+        reporte.to_csv(csv, mode='a', header=not os.path.exists(csv), index=False)
+        self._marcar(hechos)
+
+    def excel(self):
+        # El libro se arma leyendo los CSV por partes, sin cargarlos completos
+        if not os.path.exists(os.path.join(self.directorio, 'Resultado.csv')):
+            return None
+        hojas = {}
+        for tabla in ['Resultado', 'Periodos', 'Notas', 'Duplicados']:
+            csv = os.path.join(self.directorio, f'{tabla}.csv')
+            if os.path.exists(csv):
+                hojas[tabla] = pd.read_csv(csv, dtype=str, chunksize=50000)
+        hojas['Resultado'] = (
+            formatear(df.drop(columns='Archivo'), COLUMNAS['Resultado'][:-1])
+            for df in hojas['Resultado']
+        )
+        return exportar_excel(hojas, os.path.join(self.directorio, 'Resultado.xlsx'))
+
+def procesar_carpeta(entrada, salida, minADA=REGLAS.minimo_ad_a, carrera='MEDICINA', max_workers=None, tam_bloque=None):
+    salidas = Salidas(salida)
+    max_workers = max_workers or MAX_WORKERS
+    # Se procesa por bloques para no mantener todos los PDF en memoria
+    tam_bloque = tam_bloque or max_workers * 4
+    # Los duplicados (copias idénticas u otro escaneo del mismo certificado) no se procesan;
+    # otro escaneo solo se descarta cuando su original se procesó bien
+    dedup = Deduplicador(esperar_original=True)
+    for clave, nombre, huella in salidas.previos:
+        dedup.registrar(nombre, clave, huella)
+    total = omitidos = 0
+    pendientes = []
+    # nombre -> hash de los archivos que el Deduplicador no dejó pasar
+    sin_procesar = {}
+
+    # Un solo pool para todos los bloques: los trabajadores no se vuelven a crear (ni a
+    # importar las bibliotecas de PDF) en cada bloque
+    trabajadores = Trabajadores(max_workers)
+
+    def procesar_bloque(pendientes):
+        # Devuelve los índices de los archivos que fallaron
+        frames = {tabla: [] for tabla in COLUMNAS if tabla != 'Duplicados'}
+        fallidos = set()
+        nombres = [(nombre, datos) for _, nombre, datos, _ in pendientes]
+        for i, nombre, resultado, error in procesar_lote(nombres, minADA, carrera, trabajadores=trabajadores):
+            if error is None and isinstance(resultado[0], str):
+                error = resultado[0]
+            if error is not None:
+                fallidos.add(i)
+                frames['Errores'].append(pd.DataFrame([[nombre, error]], columns=['Archivo', 'Error']))
+                continue
+            result, data, count, notaR, periodos, es_letras = resultado
+            frames['Resultado'].append(result.to_frame().T.assign(Archivo=nombre))
+            frames['Periodos'].append(periodos)
+            frames['Notas'].append(data)
+        # Los archivos que fallaron (también por tiempo o memoria) no van al checkpoint
+        salidas.escribir(frames, [
+            (clave, nombre, huella)
+            for i, (clave, nombre, _, huella) in enumerate(pendientes) if i not in fallidos
+        ])
+        return fallidos
+
+    def agregar(clave, nombre, datos):
+        nuevo = dedup.revisar(nombre, datos, clave)
+        if nuevo is None:
+            sin_procesar[nombre] = clave
+        else:
+            pendientes.append((clave, nombre, datos, nuevo[1]))
+
+    def vaciar():
+        nonlocal total
+        bloque = pendientes[:]
+        pendientes.clear()
+        fallidos = procesar_bloque(bloque)
+        total += len(bloque)
+        # Los escaneos retenidos de un original que falló vuelven a revisarse
+        for i, (_, _, _, huella) in enumerate(bloque):
+            if huella is not None:
+                for nombre, datos, clave in dedup.resolver(huella, i not in fallidos):
+                    del sin_procesar[nombre]
+                    agregar(clave, nombre, datos)
+
+    try:
+        for nombre, leer in listar_pdfs(entrada):
+            datos = leer()
+            clave = hash_pdf(datos)
+            if clave in salidas.procesados:
+                omitidos += 1
+                continue
+            agregar(clave, nombre, datos)
+            if len(pendientes) >= tam_bloque:
+                vaciar()
+                print(f'{total} archivos procesados ({omitidos} omitidos, {len(dedup.duplicados)} duplicados)', file=sys.stderr)
+        while pendientes:
+            vaciar()
+    finally:
+        trabajadores.cerrar()
+    # Los duplicados también van al checkpoint, sin huella
+    salidas.duplicados(dedup.reporte(), [(sin_procesar[nombre], nombre, None) for nombre, _, _ in dedup.duplicados])
+    print(f'{total} archivos procesados ({omitidos} omitidos, {len(dedup.duplicados)} duplicados)', file=sys.stderr)
+    return salidas.excel()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m notas',
+        description='Evalúa en lote una carpeta o archivo ZIP de certificados COE/CLA.'
+    )
+    parser.add_argument('entrada', help='Carpeta o archivo .zip con los PDF')
+    parser.add_argument('-o', '--salida', default='resultados', help='Carpeta de salida (por defecto: resultados)')
+    parser.add_argument('--carrera', choices=CARRERAS, default='MEDICINA')
+    parser.add_argument('--min-ada', type=int, default=REGLAS.minimo_ad_a, help='Cantidad mínima de AD y A para aprobar')
+    parser.add_argument('--workers', type=int, default=None, help='Cantidad de procesos')
+    parser.add_argument('--bloque', type=int, default=None, help='Archivos por bloque escrito')
+    parser.add_argument('--metricas', help='Archivo donde escribir los tiempos por etapa (Prometheus, o JSON si termina en .json)')
+    args = parser.parse_args(argv)
+    if args.metricas:
+        metricas.activar()
+    ruta = procesar_carpeta(args.entrada, args.salida, args.min_ada, CARRERAS[args.carrera], args.workers, args.bloque)
+    if args.metricas:
+        metricas.exportar(args.metricas, CONTADORES)
+    if ruta:
+        print(ruta)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from .notas import LETRAS
+
+# Representación compacta de la tabla de notas (la salida de procesar_pdf):
+# - textos repetidos (DNI, DOCUMENTO, TIPO, DESC, COMP, CODMOD) como categorías
+# - GRADO ('3.°') como int8 y AÑO como int16
+# - NOTA en dos columnas: NOTA_VALOR (float32, vacía en las literales) y
+#   NOTA_LITERAL (categoría con AD/A/B/C y cualquier otra literal encontrada)
+# expandir() devuelve la tabla original, que es la que usan las reglas.
+
+CATEGORICAS = ['DNI', 'DOCUMENTO', 'TIPO', 'DESC', 'COMP', 'CODMOD']
+
+def es_compacto(df):
+    return 'NOTA_VALOR' in df.columns
+
+def compactar(df):
+    if es_compacto(df):
+        return df
+    compacto = {}
+    for col in df.columns:
+        if col == 'NOTA':
+            valor = pd.to_numeric(df['NOTA'], errors='coerce')
+            literal = df['NOTA'].where(valor.isna())
+            otras = sorted(set(literal.dropna().astype(str)) - set(LETRAS))
+            compacto['NOTA_VALOR'] = valor.astype(np.float32)
+            compacto['NOTA_LITERAL'] = pd.Categorical(literal, categories=LETRAS + otras)
+        elif col == 'GRADO':
+            compacto['GRADO'] = df['GRADO'].str.extract(r'(\d+)', expand=False).astype(np.int8)
+        elif col == 'AÑO':
+            compacto['AÑO'] = df['AÑO'].astype(np.int16)
+        elif col in CATEGORICAS:
+            # Siempre con categorías de texto: una columna vacía (float) no se podría unir
+            compacto[col] = df[col].astype(object).astype('category')
+        else:
+            compacto[col] = df[col]
+    return pd.DataFrame(compacto, index=df.index)
+
+def _nota(valor, literal):
+    # Las notas numéricas vuelven como texto, igual que salen del PDF
+    nota = literal.astype(object)
+    numero = valor.notna()
+    entero = numero & (valor == np.floor(valor))
+    nota[entero] = valor[entero].astype(np.int64).astype(str)
+    nota[numero & ~entero] = valor[numero & ~entero].astype(str)
+    return nota
+
+def expandir(df):
+    if not es_compacto(df):
+        return df
+    expandido = {}
+    for col in df.columns:
+        if col == 'NOTA_VALOR':
+            expandido['NOTA'] = _nota(df['NOTA_VALOR'], df['NOTA_LITERAL'])
+        elif col == 'NOTA_LITERAL':
+            continue
+        elif col == 'GRADO':
+            expandido['GRADO'] = df['GRADO'].astype(str) + '.°'
+        elif col == 'AÑO':
+            expandido['AÑO'] = df['AÑO'].astype(str)
+        elif col in CATEGORICAS:
+            expandido[col] = df[col].astype(object)
+        else:
+            expandido[col] = df[col]
+    return pd.DataFrame(expandido, index=df.index)
+
+def concatenar(partes):
+    # pd.concat convierte a object las categorías que no coinciden; aquí se unen antes
+    partes = [p for p in partes if len(p.columns)]
+    if not partes:
+        return pd.DataFrame()
+    for col in partes[0].columns:
+        if isinstance(partes[0][col].dtype, pd.CategoricalDtype) and all(col in p.columns for p in partes):
+            categorias = union_categoricals([p[col] for p in partes]).categories
+            if col == 'NOTA_LITERAL':
+                # AD/A/B/C siempre primero, como en compactar()
+                categorias = LETRAS + [c for c in categorias if c not in LETRAS]
+            partes = [p.assign(**{col: p[col].cat.set_categories(categorias)}) for p in partes]
+    return pd.concat(partes, ignore_index=True)
+
+def reporte_memoria(df):
+    # Bytes por columna antes y después de compactar
+    compacto = compactar(df)
+    antes = df.memory_usage(deep=True, index=False)
+    despues = compacto.memory_usage(deep=True, index=False).rename({'NOTA_VALOR': 'NOTA'})
+    despues['NOTA'] += compacto['NOTA_LITERAL'].memory_usage(deep=True, index=False)
+    reporte = pd.DataFrame({'original': antes, 'compacto': despues.reindex(antes.index)})
+    reporte.loc['TOTAL'] = reporte.sum()
+    reporte['reduccion'] = 1 - reporte['compacto'] / reporte['original']
+    return reporte
@@ -0,0 +1,86 @@
+import io
+import pandas as pd
+from .notas import read_data
+from .cache import hash_pdf
+from .metricas import medir
+
+# Detección de certificados repetidos antes de procesarlos:
+# - copias idénticas: mismo hash de los bytes (el mismo que usa la caché)
+# - copias distintas del mismo certificado (otro escaneo o descarga): misma huella del
+#   texto de la primera página, es decir, documento + DNI + nombre tal como los extrae
+#   read_data, que cuesta una lectura de pypdf y no pasa por Ghostscript ni camelot
+# Solo se procesa el primer archivo de cada grupo; los demás se informan en reporte().
+
+IDENTICO = 'Archivo idéntico'
+MISMO_CERTIFICADO = 'Mismo documento, DNI y nombre'
+
+def huella(datos):
+    # None si la primera página no tiene texto legible: ese archivo no se compara
+    with medir('huella'):
+        try:
+            dni, nombre, documento = read_data(io.BytesIO(datos))
+        except Exception:
+            return None
+    return '|'.join([documento, dni, ' '.join(nombre.split()).upper()])
+
+class Deduplicador:
+    # Recuerda el primer archivo de cada hash y de cada huella. huellas es un diccionario
+    # hash -> huella que se puede conservar entre revisiones para no volver a leer los PDF.
+    # Con esperar_original, otro escaneo del mismo certificado no se informa como duplicado
+    # hasta que resolver() confirma que el original se procesó bien; si el original falla,
+    # resolver() devuelve los escaneos retenidos para volver a revisarlos
+
+    def __init__(self, huellas=None, esperar_original=False):
+        self.huellas = {} if huellas is None else huellas
+        self.esperar_original = esperar_original
+        self.por_hash = {}
+        self.por_huella = {}
+        self.duplicados = []
+        # huella del original sin confirmar -> [(nombre, datos, clave)] de los otros escaneos
+        self.retenidos = {}
+
+    def registrar(self, nombre, clave, huella_pdf=None):
+        # Para archivos ya procesados antes (por ejemplo, en una ejecución anterior)
+        self.por_hash.setdefault(clave, nombre)
+        if huella_pdf:
+            self.por_huella.setdefault(huella_pdf, nombre)
+
+    def revisar(self, nombre, datos, clave=None):
+        # Devuelve (clave, huella) si el archivo es nuevo; si es un duplicado lo anota
+        # y devuelve None
+        clave = clave or hash_pdf(datos)
+        if clave in self.por_hash:
+            self.duplicados.append((nombre, self.por_hash[clave], IDENTICO))
+            return None
+        if clave not in self.huellas:
+            self.huellas[clave] = huella(datos)
+        huella_pdf = self.huellas[clave]
+        if huella_pdf is not None and huella_pdf in self.por_huella:
+            original = self.por_huella[huella_pdf]
+            # Otra copia idéntica de este archivo se informa contra el mismo original
+            self.por_hash[clave] = original
+            if huella_pdf in self.retenidos:
+                self.retenidos[huella_pdf].append((nombre, datos, clave))
+            else:
+                self.duplicados.append((nombre, original, MISMO_CERTIFICADO))
+            return None
+        self.registrar(nombre, clave, huella_pdf)
+        if self.esperar_original and huella_pdf is not None:
+            self.retenidos[huella_pdf] = []
+        return clave, huella_pdf
+
+    def resolver(self, huella_pdf, exito):
+        # Después de procesar el original de huella_pdf. Devuelve los escaneos que hay que
+        # volver a revisar (vacío si el original se procesó bien)
+        retenidos = self.retenidos.pop(huella_pdf, [])
+        if exito:
+            original = self.por_huella[huella_pdf]
+            self.duplicados.extend((nombre, original, MISMO_CERTIFICADO) for nombre, _, _ in retenidos)
+            return []
+        del self.por_huella[huella_pdf]
+        for _, _, clave in retenidos:
+            self.por_hash.pop(clave, None)
+        return retenidos
+
+    def reporte(self):
+        return pd.DataFrame(self.duplicados, columns=['Archivo', 'Original', 'Motivo'])
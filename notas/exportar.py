@@ -0,0 +1,104 @@
+import io
+import gzip
+import zipfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+from .compacto import expandir
+
+# Exportación de resultados por partes: el libro de Excel se escribe fila por fila con
+# constant_memory (XlsxWriter no guarda la hoja completa en memoria) y Parquet/CSV se
+# escriben en bloques, de modo que exportar decenas de miles de filas no duplica la memoria.
+
+FILAS_POR_BLOQUE = 20000
+MAX_FILAS_EXCEL = 1048576
+# Columnas que se exportan como números; las demás, como texto
+NUMERICAS = ['Prom1a4', 'Prom1a5', 'AD', 'A', 'B', 'C', 'MinADyA', 'Cantidad']
+
+def hojas_de(resultados):
+    # Hojas que se exportan de un objeto Resultados; las notas se expanden por bloques
+    return {
+        'Resultado': resultados.results,
+        'Periodos': resultados.periodos,
+        'Notas': (expandir(df) for df in _bloques(resultados.data)),
+    }
+
+def _bloques(partes):
+    # Acepta un DataFrame o un iterable de DataFrames (por ejemplo, read_csv con chunksize)
+    if isinstance(partes, pd.DataFrame):
+        partes = [partes]
+    for df in partes:
+        for i in range(0, len(df), FILAS_POR_BLOQUE):
+            yield df.iloc[i:i + FILAS_POR_BLOQUE]
+
+def _filas(df):
+    # Tipos de Python y celdas vacías en lugar de NaN
+    df = df.astype(object)
+    return df.where(df.notna(), None).values.tolist()
+
+def formatear(df, columnas=None, numericas=NUMERICAS):
+    # Columnas fijas y tipos uniformes (float o texto), para que todos los bloques
+    # escritos en Parquet tengan el mismo esquema
+    df = df.reindex(columns=columnas if columnas is not None else df.columns)
+    for col in df.columns:
+        if col in numericas:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(float)
+        else:
+            df[col] = df[col].map(lambda x: None if pd.isna(x) else str(x)).astype(object)
+    return df
+
+def esquema(columnas, numericas=NUMERICAS):
+    # Esquema fijo: una columna vacía en un bloque no debe cambiar su tipo
+    return pa.schema([(c, pa.float64() if c in numericas else pa.string()) for c in columnas])
+
+def exportar_excel(hojas, destino):
+    # hojas: {nombre: DataFrame o iterable de DataFrames}; destino: ruta o archivo binario
+    libro = xlsxwriter.Workbook(destino, {'constant_memory': True, 'nan_inf_to_errors': True})
+    negrita = libro.add_format({'bold': True})
+    for nombre, partes in hojas.items():
+        hoja, fila, columnas, n = None, 0, None, 0
+        for df in _bloques(partes):
+            for valores in _filas(df):
+                if hoja is None or fila >= MAX_FILAS_EXCEL:
+                    # Si no entra en una hoja, continúa en "Nombre (2)", "Nombre (3)", ...
+                    n += 1
+                    hoja = libro.add_worksheet(nombre if n == 1 else f'{nombre} ({n})')
+                    columnas = list(df.columns)
+                    hoja.write_row(0, 0, columnas, negrita)
+                    fila = 1
+                hoja.write_row(fila, 0, valores)
+                fila += 1
+        if hoja is None:
+            hoja = libro.add_worksheet(nombre)
+            if isinstance(partes, pd.DataFrame):
+                hoja.write_row(0, 0, list(partes.columns), negrita)
+    libro.close()
+    return destino
+
+def _parquet(partes, archivo):
+    escritor = None
+    for df in _bloques(partes):
+        tabla = pa.Table.from_pandas(formatear(df), schema=esquema(df.columns), preserve_index=False)
+        if escritor is None:
+            escritor = pq.ParquetWriter(archivo, tabla.schema, compression='zstd')
+        escritor.write_table(tabla)
+    if escritor is not None:
+        escritor.close()
+
+def _csv_gz(partes, archivo):
+    with gzip.GzipFile(fileobj=archivo, mode='wb') as gz, io.TextIOWrapper(gz, encoding='utf-8', newline='') as texto:
+        for i, df in enumerate(_bloques(partes)):
+            df.to_csv(texto, header=i == 0, index=False)
+
+def exportar_zip(hojas, destino, formato='parquet'):
+    # Un archivo .parquet o .csv.gz por hoja, dentro de un ZIP sin volver a comprimir
+    with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for nombre, partes in hojas.items():
+            if formato == 'parquet':
+                with zf.open(f'{nombre}.parquet', 'w') as archivo:
+                    _parquet(partes, archivo)
+            else:
+                with zf.open(f'{nombre}.csv.gz', 'w') as archivo:
+                    _csv_gz(partes, archivo)
+    return destino
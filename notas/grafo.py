@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+from .notas import COLUMNAS_RESULTADO, REGLAS, rasgos_estudiante, aplicar_reglas, decidir_excepcion, decidir_periodos
+from .compacto import compactar
+from .resultados import Resultados
+
+# Reevaluación incremental: las reglas se separan en rasgos por estudiante, que se calculan
+# una sola vez al agregarlo (rasgos_estudiante), y decisiones vectorizadas que dependen de
+# minADA o de la carrera. Al cambiar un parámetro solo se recalculan los nodos que dependen
+# de él; los rasgos y las notas no se vuelven a tocar.
+
+class Grafo:
+    # Grafo de dependencias mínimo. Las entradas y los nodos tienen una versión; un nodo se
+    # recalcula solo si cambió la versión de alguna de sus dependencias desde la última vez.
+
+    def __init__(self):
+        self._valores = {}
+        self._versiones = {}
+        self._nodos = {}
+        self._firmas = {}
+        self.recalculos = {}
+
+    def entrada(self, nombre, valor):
+        if nombre in self._valores and self._valores[nombre] == valor:
+            return
+        self._valores[nombre] = valor
+        self._versiones[nombre] = self._versiones.get(nombre, 0) + 1
+
+    def tocar(self, nombre):
+        # Para entradas que cambian en el lugar (por ejemplo, una lista a la que se agrega)
+        self._versiones[nombre] = self._versiones.get(nombre, 0) + 1
+
+    def nodo(self, nombre, dependencias, funcion):
+        self._nodos[nombre] = (dependencias, funcion)
+        self._versiones[nombre] = 0
+
+    def _version(self, nombre):
+        if nombre in self._nodos:
+            self.valor(nombre)
+        return self._versiones[nombre]
+
+    def valor(self, nombre):
+        if nombre not in self._nodos:
+            return self._valores[nombre]
+        dependencias, funcion = self._nodos[nombre]
+        firma = tuple(self._version(d) for d in dependencias)
+        if self._firmas.get(nombre) != firma:
+            self._valores[nombre] = funcion(*(self.valor(d) for d in dependencias))
+            self._firmas[nombre] = firma
+            self._versiones[nombre] += 1
+            self.recalculos[nombre] = self.recalculos.get(nombre, 0) + 1
+        return self._valores[nombre]
+
+
+def _concatenar(partes):
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+def _excepcion(rasgos, minADA):
+    return decidir_excepcion(rasgos, minADA) if len(rasgos) else pd.Series(dtype=object, name='Excepcion')
+
+def _resultados(base, excepcion, minADA):
+    if base.empty:
+        return pd.DataFrame(columns=COLUMNAS_RESULTADO)
+    return base.assign(Excepcion=np.asarray(excepcion), MinADyA=minADA)[COLUMNAS_RESULTADO]
+
+def _periodos(rasgos, carrera):
+    return decidir_periodos(rasgos, carrera) if len(rasgos) else pd.DataFrame()
+
+
+class GrafoResultados(Resultados):
+    # Resultados que se actualizan al instante cuando cambian minADA o la carrera.
+    # agregar() recibe la extracción (no la salida de evaluar) y devuelve lo que
+    # devolvería evaluar() con los parámetros actuales.
+
+    def __init__(self, minADA=REGLAS.minimo_ad_a, carrera='MEDICINA'):
+        super().__init__()
+        # Rasgos de cada estudiante agregado, en el mismo orden que las tablas
+        self._rasgos = {'base': [], 'excepcion': [], 'periodos': []}
+        # Clave (hash del PDF) de cada estudiante agregado, en el mismo orden
+        self.claves = []
+        grafo = self.grafo = Grafo()
+        grafo.entrada('minADA', minADA)
+        grafo.entrada('carrera', carrera)
+        grafo.entrada('estudiantes', self._rasgos)
+        grafo.nodo('base', ['estudiantes'], lambda r: pd.DataFrame(r['base']).reset_index(drop=True))
+        grafo.nodo('rasgos_excepcion', ['estudiantes'], lambda r: _concatenar(r['excepcion']))
+        grafo.nodo('rasgos_periodos', ['estudiantes'], lambda r: _concatenar(r['periodos']))
+        grafo.nodo('excepcion', ['rasgos_excepcion', 'minADA'], _excepcion)
+        grafo.nodo('results', ['base', 'excepcion', 'minADA'], _resultados)
+        grafo.nodo('periodos', ['rasgos_periodos', 'carrera'], _periodos)
+
+    @property
+    def minADA(self):
+        return self.grafo.valor('minADA')
+
+    @property
+    def carrera(self):
+        return self.grafo.valor('carrera')
+
+    def fijar(self, minADA=None, carrera=None):
+        if minADA is not None:
+            self.grafo.entrada('minADA', minADA)
+        if carrera is not None:
+            self.grafo.entrada('carrera', carrera)
+
+    def agregar(self, extraccion, clave=None):
+        dni = extraccion[0]
+        if isinstance(dni, str) and "No cumple con el requisito" in dni:
+            return dni, None, None, None, None, None
+        rasgos = rasgos_estudiante(extraccion)
+        self._rasgos['base'].append(rasgos['base'])
+        self._rasgos['excepcion'].append(rasgos['excepcion'])
+        self._rasgos['periodos'].append(rasgos['periodos'])
+        self.claves.append(clave)
+        self._partes['data'].append(compactar(rasgos['data']))
+        self._partes['counts'].append(rasgos['counts'])
+        self._partes['promedios'].append(rasgos['notaR'])
+        self.grafo.tocar('estudiantes')
+        self.ultimo_dni = dni
+        self._tablas.clear()
+        self._indices.clear()
+        return aplicar_reglas(rasgos, self.minADA, self.carrera)
+
+    def __len__(self):
+        return len(self._rasgos['base'])
+
+    def decisiones(self):
+        # (clave, resultado, periodos) de cada estudiante con los parámetros actuales. Las
+        # filas de periodos siguen el orden de los rasgos: las de cada estudiante son un tramo
+        results, periodos = self.results, self.periodos
+        inicio = 0
+        for i, (clave, rasgos) in enumerate(zip(self.claves, self._rasgos['periodos'])):
+            fin = inicio + len(rasgos)
+            yield clave, results.iloc[i], periodos.iloc[inicio:fin]
+            inicio = fin
+
+    def tabla(self, nombre):
+        if nombre not in ('results', 'periodos'):
+            return super().tabla(nombre)
+        df = self.grafo.valor(nombre)
+        if self._tablas.get(nombre) is not df:
+            # El grafo recalculó la tabla: los índices por DNI ya no sirven
+            self._tablas[nombre] = df
+            self._indices.pop(nombre, None)
+        return df
@@ -0,0 +1,272 @@
+import os
+import signal
+import shutil
+import weakref
+import tempfile
+import threading
+import faulthandler
+import multiprocessing
+import multiprocessing.util
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from .notas import evaluar, directorio_temporal, CONTADORES
+from .cache import hash_pdf, cache_por_defecto
+from . import metricas
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Cantidad de procesos por defecto (se puede fijar con la variable NOTAS_WORKERS)
+MAX_WORKERS = int(os.environ.get('NOTAS_WORKERS', 0)) or os.cpu_count() or 1
+# Cada trabajador se reemplaza por uno nuevo después de esta cantidad de archivos, para que
+# la memoria que dejan camelot/OpenCV y pdfminer no se acumule en un servidor que corre todo el día
+TAREAS_POR_TRABAJADOR = int(os.environ.get('NOTAS_TAREAS_POR_TRABAJADOR', 20))
+# Archivos en proceso a la vez por cada trabajador; el resto espera fuera del pool
+# (NOTAS_EN_CURSO_POR_TRABAJADOR)
+EN_CURSO_POR_TRABAJADOR = int(os.environ.get('NOTAS_EN_CURSO_POR_TRABAJADOR', 2))
+# Límite de memoria (espacio de direcciones, MB) de cada trabajador y de tiempo (s) por archivo;
+# 0 desactiva el límite. Un archivo que los supera termina con error sin afectar a los demás
+MEMORIA_MB = int(os.environ.get('NOTAS_MEMORIA_MB', 2048))
+TIEMPO_LIMITE = int(os.environ.get('NOTAS_TIEMPO_LIMITE', 120))
+# SIGALRM no interrumpe código en C (Ghostscript, OpenCV): si el archivo sigue después de
+# estos segundos adicionales, el trabajador termina y el archivo se reintenta solo
+GRACIA = 15
+ERROR_TRABAJADOR = 'El proceso de extracción terminó inesperadamente (límite de tiempo o de memoria)'
+
+# Directorio temporal propio de cada proceso trabajador; cada archivo usa uno propio dentro
+_TEMP = None
+
+class TiempoExcedido(BaseException):
+    # No hereda de Exception para que los except Exception de la extracción (los que pasan
+    # al otro motor o reparan el PDF) no la atrapen y sigan trabajando después del límite
+    pass
+
+def _tiempo_excedido(signum, frame):
+    raise TiempoExcedido(f'Se superó el tiempo límite de {TIEMPO_LIMITE} s por archivo')
+
+def _iniciar_trabajador(base):
+    global _TEMP
+    _TEMP = tempfile.TemporaryDirectory(dir=base)
+    # Los procesos del pool terminan sin pasar por atexit: el directorio se borra con los
+    # finalizadores de multiprocessing, también cuando el trabajador se recicla
+    multiprocessing.util.Finalize(None, _TEMP.cleanup, exitpriority=10)
+    # Por si el proceso se creó con fork: no debe arrastrar los tiempos del proceso principal
+    metricas.reiniciar()
+    if resource is not None and MEMORIA_MB:
+        _, maximo = resource.getrlimit(resource.RLIMIT_AS)
+        limite = MEMORIA_MB * 1024 * 1024
+        if maximo != resource.RLIM_INFINITY:
+            limite = min(limite, maximo)
+        resource.setrlimit(resource.RLIMIT_AS, (limite, maximo))
+    if hasattr(signal, 'SIGALRM') and TIEMPO_LIMITE:
+        signal.signal(signal.SIGALRM, _tiempo_excedido)
+
+def crear_pool(max_workers):
+    # fork no es seguro desde un proceso con hilos (Streamlit, tornado, la cola): se usa
+    # forkserver (o spawn donde no existe)
+    metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    # Los directorios de los trabajadores quedan dentro de uno del pool, que se borra con el
+    # pool: también los de un trabajador que se terminó sin limpiar
+    base = tempfile.mkdtemp(dir=directorio_temporal(), prefix='notas-')
+    pool = ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context(metodo),
+        initializer=_iniciar_trabajador,
+        initargs=(base,),
+    )
+    weakref.finalize(pool, shutil.rmtree, base, ignore_errors=True)
+    return pool
+
+def _retirar(pool, cancelar=False):
+    # Termina el pool sin esperar: el hilo lo mantiene vivo hasta que acaben sus tareas, así
+    # su directorio temporal no se borra antes
+    threading.Thread(target=pool.shutdown, kwargs={'cancel_futures': cancelar}, daemon=True).start()
+
+class Trabajadores:
+    # Pool de crear_pool que se crea al primer uso y lo comparten los bloques de un lote. Se
+    # reemplaza cuando muere un trabajador (un pool roto ya no acepta tareas) y cuando recibió
+    # TAREAS_POR_TRABAJADOR archivos por proceso: así se reciclan los trabajadores, porque
+    # max_tasks_per_child de ProcessPoolExecutor se cuelga en Python 3.11 si hay tareas en cola
+    # al reemplazar un proceso
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or MAX_WORKERS
+        self.tareas_por_pool = self.max_workers * TAREAS_POR_TRABAJADOR
+        self._pool = None
+        self._enviadas = 0
+        self._lock = threading.Lock()
+
+    def _siguiente(self):
+        with self._lock:
+            if self._pool is not None and self.tareas_por_pool and self._enviadas >= self.tareas_por_pool:
+                _retirar(self._pool)
+                self._pool = None
+            if self._pool is None:
+                self._pool = crear_pool(self.max_workers)
+                self._enviadas = 0
+            self._enviadas += 1
+            return self._pool
+
+    def enviar(self, *args):
+        # Envía una extracción (los argumentos de _extraer_en_trabajador) y devuelve
+        # (pool, futuro); si el pool se rompió justo antes, se reemplaza y se envía al nuevo
+        pool = self._siguiente()
+        try:
+            return pool, pool.submit(_extraer_en_trabajador, *args)
+        except BrokenProcessPool:
+            self.descartar(pool)
+            pool = self._siguiente()
+            return pool, pool.submit(_extraer_en_trabajador, *args)
+
+    def descartar(self, pool):
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+        _retirar(pool)
+
+    def cerrar(self, esperar=True):
+        # Sin esperar se cancelan las tareas que todavía no empezaron
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        if esperar:
+            pool.shutdown()
+        else:
+            _retirar(pool, cancelar=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+        return False
+
+def _extraer_archivo(i, nombre, datos, cache):
+    # Solo en un proceso trabajador: cambia tempfile.tempdir y usa SIGALRM.
+    # Los temporales del archivo (camelot, Ghostscript) se borran al terminar, aunque falle
+    alarma = hasattr(signal, 'SIGALRM') and TIEMPO_LIMITE
+    try:
+        with tempfile.TemporaryDirectory(dir=_TEMP.name) as tmp:
+            try:
+                # camelot crea sus propios temporales con tempfile: que también queden aquí
+                tempfile.tempdir = tmp
+                if alarma:
+                    try:
+                        faulthandler.dump_traceback_later(TIEMPO_LIMITE + GRACIA, exit=True)
+                    except RuntimeError:
+                        # No queda memoria ni para el hilo que vigila el tiempo
+                        raise MemoryError
+                    signal.alarm(TIEMPO_LIMITE)
+                return i, nombre, cache.extraer(datos, pwd=tmp), None
+            finally:
+                if alarma:
+                    signal.alarm(0)
+                    faulthandler.cancel_dump_traceback_later()
+                tempfile.tempdir = _TEMP.name
+    except MemoryError:
+        CONTADORES['memoria_excedida'] += 1
+        return i, nombre, None, f'Se superó el límite de memoria de {MEMORIA_MB} MB por archivo'
+    except TiempoExcedido as e:
+        CONTADORES['tiempo_excedido'] += 1
+        return i, nombre, None, str(e)
+    except Exception as e:
+        # Las excepciones se devuelven como texto para no depender de que sean serializables
+        return i, nombre, None, str(e)
+
+def _extraer_en_trabajador(i, nombre, datos, cache, medir=False):
+    # Los contadores y tiempos de cada trabajador se devuelven para sumarlos en el proceso principal;
+    # medir viene con la tarea porque el trabajador no ve lo que se activa después en el principal
+    antes = CONTADORES.copy()
+    with metricas.midiendo(medir):
+        salida = _extraer_archivo(i, nombre, datos, cache)
+    return salida, CONTADORES - antes, metricas.extraer()
+
+def extraer_aislado(i, nombre, datos, cache, medir=False):
+    # Para un archivo que estaba en curso cuando murió un trabajador: se extrae solo, en un
+    # pool propio de un proceso, para saber si fue él quien lo terminó. Devuelve lo mismo que
+    # _extraer_en_trabajador
+    with crear_pool(1) as pool:
+        try:
+            return pool.submit(_extraer_en_trabajador, i, nombre, datos, cache, medir).result()
+        except BrokenProcessPool:
+            CONTADORES['trabajador_terminado'] += 1
+            return (i, nombre, None, ERROR_TRABAJADOR), Counter(), {}
+
+def _evaluar(salida, minADA, carrera):
+    i, nombre, extraccion, error = salida
+    if error is not None:
+        return i, nombre, None, error
+    try:
+        return i, nombre, evaluar(extraccion, minADA, carrera), None
+    except Exception as e:
+        return i, nombre, None, str(e)
+
+# Procesa una lista de archivos (nombre, bytes) en paralelo y devuelve tuplas
+# (indice, nombre, resultado, error) en el orden en que terminan, no en el de carga.
+# La extracción se toma de la caché cuando existe; las reglas se evalúan siempre aquí.
+# trabajadores: un Trabajadores para reutilizar el pool entre llamadas (lo cierra quien lo
+# creó); sin él se crea uno para este lote. Siempre se extrae en procesos aparte, también
+# con un solo trabajador, para aplicar los mismos límites de memoria y tiempo.
+def procesar_lote(archivos, minADA, carrera, max_workers=None, cache=None, trabajadores=None):
+    yield from _procesar_lote(archivos, minADA, carrera, max_workers, cache, trabajadores)
+    metricas.exportar(contadores=CONTADORES)
+
+def _procesar_lote(archivos, minADA, carrera, max_workers, cache, trabajadores):
+    cache = cache or cache_por_defecto()
+    pendientes = []
+    for i, (nombre, datos) in enumerate(archivos):
+        extraccion = cache.obtener(hash_pdf(datos))
+        if extraccion is None:
+            pendientes.append((i, nombre, datos))
+        else:
+            yield _evaluar((i, nombre, extraccion, None), minADA, carrera)
+    if not pendientes:
+        return
+    if trabajadores is not None:
+        yield from _extraer_en_pool(trabajadores, pendientes, minADA, carrera, cache)
+        return
+    with Trabajadores(min(max_workers or MAX_WORKERS, len(pendientes))) as trabajadores:
+        yield from _extraer_en_pool(trabajadores, pendientes, minADA, carrera, cache)
+
+def _extraer_en_pool(trabajadores, pendientes, minADA, carrera, cache):
+    # Se envían de a pocos archivos, como en la cola de la aplicación, para que cada pool
+    # termine lo suyo poco después de que Trabajadores lo reemplace
+    medir = metricas.activas()
+    en_curso = trabajadores.max_workers * EN_CURSO_POR_TRABAJADOR
+    pendientes = iter(pendientes)
+    futuros = {}
+    caidos = []
+    while True:
+        for i, nombre, datos in pendientes:
+            pool, futuro = trabajadores.enviar(i, nombre, datos, cache, medir)
+            futuros[futuro] = (i, nombre, datos, pool)
+            if len(futuros) >= en_curso:
+                break
+        if not futuros:
+            break
+        hechos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+        for futuro in hechos:
+            i, nombre, datos, pool = futuros.pop(futuro)
+            try:
+                salida, contadores, tiempos = futuro.result()
+            except BrokenProcessPool:
+                # Los archivos siguientes van a un pool nuevo
+                trabajadores.descartar(pool)
+                caidos.append((i, nombre, datos))
+                continue
+            CONTADORES.update(contadores)
+            metricas.combinar(tiempos)
+            yield _evaluar(salida, minADA, carrera)
+    if caidos:
+        # Murió un trabajador y con él fallaron todos los archivos en curso: cada uno se
+        # reintenta solo para que el error quede únicamente en el que lo causó
+        for i, nombre, datos in sorted(caidos):
+            salida, contadores, tiempos = extraer_aislado(i, nombre, datos, cache, medir)
+            CONTADORES.update(contadores)
+            metricas.combinar(tiempos)
+            yield _evaluar(salida, minADA, carrera)
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import threading
+import contextlib
+import contextvars
+
+# Tiempos por etapa del proceso (repair_pdf, read_data, camelot, procesar_tabla, reglas...)
+# acumulados en histogramas. Desactivado por defecto: se activa para todo el proceso con la
+# variable NOTAS_METRICAS=1 o con activar(), o solo para una solicitud con midiendo();
+# apagado, medir() devuelve siempre el mismo objeto vacío. Los procesos trabajadores reciben
+# con cada tarea si deben medir (activas() en el momento de enviarla).
+# Con NOTAS_METRICAS_ARCHIVO los histogramas se escriben en ese archivo al terminar cada
+# lote (formato Prometheus, o JSON si el nombre termina en .json).
+
+ACTIVO = os.environ.get('NOTAS_METRICAS', '') not in ('', '0')
+ARCHIVO = os.environ.get('NOTAS_METRICAS_ARCHIVO')
+
+# Límites superiores de los buckets, en segundos
+LIMITES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+_lock = threading.Lock()
+_histogramas = {}
+# Activación de la solicitud actual (cada sesión de Streamlit corre en su propio hilo)
+_en_contexto = contextvars.ContextVar('metricas_activas', default=False)
+
+class Histograma:
+    def __init__(self):
+        self.cuentas = [0] * len(LIMITES)
+        self.suma = 0.0
+        self.cantidad = 0
+
+    def observar(self, segundos):
+        i = 0
+        while segundos > LIMITES[i]:
+            i += 1
+        self.cuentas[i] += 1
+        self.suma += segundos
+        self.cantidad += 1
+
+    def cuantil(self, q):
+        # Límite superior del bucket donde cae el cuantil (estimación por exceso)
+        objetivo = q * self.cantidad
+        acumulado = 0
+        for limite, cuenta in zip(LIMITES, self.cuentas):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return limite
+        return LIMITES[-1]
+
+    def a_dict(self):
+        return {'cuentas': list(self.cuentas), 'suma': self.suma, 'cantidad': self.cantidad}
+
+class _Nula:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULA = _Nula()
+
+class _Medicion:
+    __slots__ = ('etapa', 'inicio')
+
+    def __init__(self, etapa):
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observar(self.etapa, time.perf_counter() - self.inicio)
+        return False
+
+def medir(etapa):
+    # with medir('camelot'): ...
+    if not (ACTIVO or _en_contexto.get()):
+        return _NULA
+    return _Medicion(etapa)
+
+def observar(etapa, segundos):
+    with _lock:
+        if etapa not in _histogramas:
+            _histogramas[etapa] = Histograma()
+        _histogramas[etapa].observar(segundos)
+
+def activar(activo=True):
+    global ACTIVO
+    ACTIVO = activo
+
+def activas():
+    return ACTIVO or _en_contexto.get()
+
+@contextlib.contextmanager
+def midiendo(activo=True):
+    # with midiendo(): ... mide solo lo que se ejecuta dentro, en este hilo
+    if not activo:
+        yield
+        return
+    token = _en_contexto.set(True)
+    try:
+        yield
+    finally:
+        _en_contexto.reset(token)
+
+def reiniciar():
+    with _lock:
+        _histogramas.clear()
+
+def extraer():
+    # Devuelve los histogramas y los reinicia; lo usan los procesos trabajadores para
+    # enviar al proceso principal solo lo medido desde la última vez
+    with _lock:
+        datos = {etapa: h.a_dict() for etapa, h in _histogramas.items()}
+        _histogramas.clear()
+    return datos
+
+def combinar(datos):
+    with _lock:
+        for etapa, d in datos.items():
+            h = _histogramas.setdefault(etapa, Histograma())
+            h.cuentas = [a + b for a, b in zip(h.cuentas, d['cuentas'])]
+            h.suma += d['suma']
+            h.cantidad += d['cantidad']
+
+def resumen():
+    with _lock:
+        return [
+            {
+                'etapa': etapa,
+                'cantidad': h.cantidad,
+                'promedio_s': h.suma / h.cantidad if h.cantidad else 0.0,
+                'p50_s': h.cuantil(0.5),
+                'p95_s': h.cuantil(0.95),
+                'total_s': h.suma,
+            }
+            for etapa, h in sorted(_histogramas.items())
+        ]
+
+def a_prometheus(contadores=None):
+    lineas = [
+        '# HELP notas_etapa_segundos Duración de cada etapa del proceso de certificados',
+        '# TYPE notas_etapa_segundos histogram',
+    ]
+    with _lock:
+        for etapa, h in sorted(_histogramas.items()):
+            acumulado = 0
+            for limite, cuenta in zip(LIMITES, h.cuentas):
+                acumulado += cuenta
+                le = '+Inf' if limite == float('inf') else repr(limite)
+                lineas.append(f'notas_etapa_segundos_bucket{{etapa="{etapa}",le="{le}"}} {acumulado}')
+            lineas.append(f'notas_etapa_segundos_sum{{etapa="{etapa}"}} {h.suma}')
+            lineas.append(f'notas_etapa_segundos_count{{etapa="{etapa}"}} {h.cantidad}')
+    if contadores:
+        lineas += ['# HELP notas_eventos_total Contadores del proceso', '# TYPE notas_eventos_total counter']
+        for evento, valor in sorted(contadores.items()):
+            lineas.append(f'notas_eventos_total{{evento="{evento}"}} {valor}')
+    return '\n'.join(lineas) + '\n'
+
+def a_json(contadores=None):
+    with _lock:
+        etapas = {etapa: h.a_dict() for etapa, h in _histogramas.items()}
+    limites = [None if l == float('inf') else l for l in LIMITES]
+    return json.dumps({'limites': limites, 'etapas': etapas, 'contadores': dict(contadores or {})}, indent=2)
+
+def exportar(ruta=None, contadores=None):
+    ruta = ruta or ARCHIVO
+    if not ruta:
+        return None
+    contenido = a_json(contadores) if ruta.endswith('.json') else a_prometheus(contadores)
+    # Se escribe en un temporal y se reemplaza para que quien lea el archivo no lo vea a medias
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+    return ruta
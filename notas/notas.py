@@ -1,14 +1,56 @@
+import io
 import os
 import re
-import math
+import time
+import logging
 import shutil
 import subprocess
-import camelot
+import tempfile
+import threading
+from collections import Counter
 import numpy as np
 import pandas as pd
-from pypdf import PdfReader
+from .metricas import medir
+from .reglas import cargar_reglas
 
-def repair_pdf(in_file, out_file):
+logger = logging.getLogger(__name__)
+
+# camelot (con OpenCV), pypdf y pdfminer se importan dentro de las funciones que los usan,
+# para que cargar el paquete (y la aplicación) no los importe antes de recibir un PDF
+
+# Motor de extracción de tablas por defecto (se puede fijar con la variable NOTAS_MOTOR).
+# Sigue siendo camelot hasta que benchmarks.ejecutar --validar muestre que el motor de texto
+# coincide con él en certificados reales
+MOTOR = os.environ.get('NOTAS_MOTOR', 'camelot')
+# Versión de la extracción: se incrementa al cambiar lo que devuelve procesar_pdf, para que
+# la caché no entregue extracciones hechas con una versión anterior
+VERSION_EXTRACCION = 2
+
+# Cuántas veces se procesó el PDF original y cuántas hubo que repararlo
+CONTADORES = Counter()
+
+# La API de Ghostscript en proceso no admite instancias simultáneas
+_gs_lock = threading.Lock()
+# Módulo ghostscript, False si no se pudo cargar (se intenta una sola vez por proceso)
+_ghostscript = None
+
+def _biblioteca_gs():
+    global _ghostscript
+    if _ghostscript is None:
+        try:
+            import ghostscript  # RuntimeError si no se encuentra la biblioteca libgs
+            _ghostscript = ghostscript
+        except Exception:
+            _ghostscript = False
+    return _ghostscript
+
+def _repair_en_proceso(gs, in_file, out_file):
+    args = ["gs", "-dSAFER", "-dNOPAUSE", "-dBATCH", "-dQUIET",
+            "-sDEVICE=pdfwrite", f"-sOutputFile={out_file}", in_file]
+    with _gs_lock:
+        gs.Ghostscript(*args).exit()
+
+def buscar_ghostscript():
     possible_paths = [
         shutil.which("gswin64c"),
         shutil.which("gswin32c"),
@@ -24,16 +66,45 @@ def repair_pdf(in_file, out_file):
     
     if not gs:
         raise RuntimeError("[ERROR] Ghostscript no encontrado en las rutas especificadas")
-    
-    subprocess.check_call(
-        [gs, "-dSAFER", "-dNOPAUSE", "-dBATCH",
-         "-sDEVICE=pdfwrite", "-o", out_file, in_file],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL
-    )
+    return gs
+
+def directorio_temporal():
+    # Donde camelot y Ghostscript escriben las imágenes de página y los PDF reparados: el
+    # temporal del sistema, u otro con NOTAS_TEMP (por ejemplo /dev/shm, para no tocar el
+    # disco, si tiene espacio suficiente: Docker le da 64 MB por defecto)
+    return os.environ.get('NOTAS_TEMP') or tempfile.gettempdir()
+
+def reparar_bytes(datos, pwd=None):
+    # Con la biblioteca cargada en el proceso no se lanza un subproceso por archivo. Si la
+    # biblioteca falla con este PDF, el ejecutable fallaría igual: el error se propaga
+    gs = _biblioteca_gs()
+    if gs:
+        # La biblioteca necesita nombres de archivo: se usa un directorio único por llamada
+        with tempfile.TemporaryDirectory(dir=pwd or directorio_temporal()) as tmp:
+            in_file, out_file = os.path.join(tmp, 'in.pdf'), os.path.join(tmp, 'out.pdf')
+            with open(in_file, 'wb') as f:
+                f.write(datos)
+            _repair_en_proceso(gs, in_file, out_file)
+            with open(out_file, 'rb') as f:
+                reparado = f.read()
+        CONTADORES['gs_en_proceso'] += 1
+        return reparado
+
+    # Sin la biblioteca, el ejecutable lee el PDF por stdin y escribe el resultado por stdout
+    reparado = subprocess.run(
+        [buscar_ghostscript(), "-q", "-dSAFER", "-dNOPAUSE", "-dBATCH",
+         "-sDEVICE=pdfwrite", "-sOutputFile=-", "-"],
+        input=datos,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True
+    ).stdout
+    CONTADORES['gs_subproceso'] += 1
+    return reparado
 
 def read_data(filepath):
-    reader = PdfReader(filepath, strict=True)
+    from pypdf import PdfReader
+    reader = filepath if isinstance(filepath, PdfReader) else PdfReader(filepath, strict=True)
     first_page = reader.pages[0]
     text = first_page.extract_text()
 
@@ -116,19 +187,20 @@ def obtener_grado_maximo(df):
     grados = df['GRADO'].str.extract(r'(\d+)')[0].astype(int)
     return grados.max()
 
-def procesar_pdf(file, pwd=os.getcwd()):
-    filename = f'{pwd}/file.pdf'
-    with open(filename, 'wb') as f:
-        f.write(file.getbuffer())
-    original = f'{filename[:-4]}_old{filename[-4:]}'
-    os.rename(filename, original)
-    repair_pdf(original, filename)
-    dni, nombre, documento = read_data(filename)
-    tables = camelot.read_pdf(filename, pages='all', strip_text='\n')
+def paginas_con_notas(reader):
+    # Páginas con la tabla de áreas curriculares; las de leyendas y firmas no tienen
+    # el encabezado "Año lectivo", que se repite en cada página de la tabla
+    paginas = []
+    for i, page in enumerate(reader.pages):
+        text = page.extract_text() or ''
+        if re.search(r'A(?:\s)*ño(?:\s)*lectivo|Áreas(?:\s)*Curriculares', text):
+            paginas.append(i + 1)
+    return paginas
+
+def unir_tablas(tables):
     tablas = []
     l = []
-    for t in tables:
-        d = t.df
+    for d in tables:
         if d.iloc[-1, 0].startswith('* Este'):
             continue
         if len(l) > 0:
@@ -137,7 +209,121 @@ def procesar_pdf(file, pwd=os.getcwd()):
         if d.iloc[-1, 0] == 'Situación final': 
             tablas.append(procesar_tabla(pd.concat(l)))
             l = []
-    res = pd.concat(tablas)
+    return pd.concat(tablas)
+
+def leer_camelot(pdf, paginas, total, documento=None):
+    import camelot
+    from .plantillas import PLANTILLAS
+    # Con el tipo de documento se intenta primero la plantilla de la misma geometría de página
+    geometria = None
+    if documento is not None:
+        with medir('plantilla'):
+            geometria, res = PLANTILLAS.leer(pdf, paginas, documento)
+        if res is not None:
+            return res
+        pdf.seek(0)
+    # Si no se reconoce ninguna página se procesa el documento completo
+    pages = ','.join(map(str, paginas)) if paginas else 'all'
+    inicio = time.perf_counter()
+    with medir('camelot'):
+        tables = camelot.read_pdf(pdf, pages=pages, strip_text='\n')
+    duracion = time.perf_counter() - inicio
+    omitidas = total - len(paginas) if paginas else 0
+    if omitidas:
+        ahorro = duracion / len(paginas) * omitidas
+        CONTADORES['paginas_omitidas'] += omitidas
+        CONTADORES['segundos_ahorrados'] += ahorro
+        logger.info('camelot en %d de %d páginas (%.2f s), ahorro estimado %.2f s',
+                    len(paginas), total, duracion, ahorro)
+    with medir('procesar_tabla'):
+        res = unir_tablas([t.df for t in tables])
+    if geometria:
+        PLANTILLAS.aprender(geometria, tables)
+    return res
+
+def leer_pdf(pdf, motor=None):
+    # motor: 'camelot', 'texto' (capa de texto de pdfminer) o 'auto' (texto y, si falla, camelot)
+    from pypdf import PdfReader
+    from .texto import leer_tablas_texto
+    motor = motor or MOTOR
+    with medir('read_data'):
+        reader = PdfReader(pdf, strict=True)
+        dni, nombre, documento = read_data(reader)
+        paginas = paginas_con_notas(reader)
+    if motor in ('texto', 'auto'):
+        try:
+            with medir('texto'):
+                tablas = leer_tablas_texto(pdf, paginas)
+            with medir('procesar_tabla'):
+                res = unir_tablas(tablas)
+            CONTADORES['motor_texto'] += 1
+            return dni, nombre, documento, res
+        except MemoryError:
+            # El límite de memoria del trabajador: otro intento solo pediría más
+            raise
+        except Exception:
+            if motor == 'texto':
+                raise
+            CONTADORES['motor_texto_fallido'] += 1
+    res = leer_camelot(pdf, paginas, len(reader.pages), documento)
+    CONTADORES['motor_camelot'] += 1
+    return dni, nombre, documento, res
+
+def comparar_motores(datos):
+    # Extrae el mismo PDF con ambos motores y devuelve las filas que no coinciden
+    from pypdf import PdfReader
+    from .texto import leer_tablas_texto
+    reader = PdfReader(io.BytesIO(datos), strict=True)
+    paginas = paginas_con_notas(reader)
+    columnas = ['TIPO', 'DESC', 'COMP', 'AÑO', 'GRADO', 'CODMOD', 'NOTA']
+    texto = unir_tablas(leer_tablas_texto(io.BytesIO(datos), paginas))[columnas].fillna('')
+    tablas = leer_camelot(io.BytesIO(datos), paginas, len(reader.pages))[columnas].fillna('')
+    # Las filas repetidas se numeran: si un motor repite una fila más veces que el otro, la
+    # copia de más queda como diferencia
+    texto['REPETICION'] = texto.groupby(columnas).cumcount()
+    tablas['REPETICION'] = tablas.groupby(columnas).cumcount()
+    diferencias = tablas.merge(texto, how='outer', indicator='MOTOR').query('MOTOR != "both"')
+    diferencias['MOTOR'] = diferencias['MOTOR'].map({'left_only': 'camelot', 'right_only': 'texto'})
+    return diferencias.drop(columns='REPETICION').reset_index(drop=True)
+
+def es_pdf(datos):
+    # La especificación admite bytes antes del encabezado, dentro del primer KB
+    return b'%PDF-' in datos[:1024]
+
+def _extraer(datos, motor):
+    dni, nombre, documento, res = leer_pdf(io.BytesIO(datos), motor)
+    with medir('preparar_notas'):
+        return preparar_notas(dni, nombre, documento, res)
+
+def procesar_pdf(file, pwd=None, motor=None):
+    # Todo el proceso trabaja sobre el contenido en memoria; camelot recibe un BytesIO
+    datos = bytes(file.getbuffer())
+    if not es_pdf(datos):
+        raise RuntimeError('El archivo no es un PDF')
+    try:
+        extraccion = _extraer(datos, motor)
+        CONTADORES['pdf_directo'] += 1
+        return extraccion
+    except MemoryError:
+        raise
+    except Exception as e:
+        # Algunos PDF se leen sin error pero su texto solo sale bien después de pasar por
+        # Ghostscript (no es COE/CLAE, falta el DNI): ante cualquier error se repara una vez
+        error = e
+    try:
+        with medir('repair_pdf'):
+            datos = reparar_bytes(datos, pwd)
+    except MemoryError:
+        raise
+    except Exception as e:
+        # Sin Ghostscript (o si tampoco puede con el archivo) se informa el error de la lectura
+        raise RuntimeError(f'{error} (no se pudo reparar el PDF: {e})') from error
+    extraccion = _extraer(datos, motor)
+    CONTADORES['pdf_reparado'] += 1
+    return extraccion
+
+def preparar_notas(dni, nombre, documento, res):
+    # Limpieza de la tabla extraída y verificación del año de egreso
     res['DNI'] = dni
     res['DOCUMENTO'] = documento
     res['TIPO'] = res['TIPO'].str.replace(' y Competencias', '')
@@ -155,6 +341,38 @@ def procesar_pdf(file, pwd=os.getcwd()):
     
     return dni, nombre, documento, res, grado_maximo
 
+# Reglas de admisión (periodos, umbrales y equivalencias), declaradas en reglas.toml
+REGLAS = cargar_reglas()
+
+# Equivalencias de las notas literales para el promedio por área
+LETRAS = REGLAS.letras
+EQUIVALENCIAS = REGLAS.equivalencias  # en el orden de LETRAS
+# COMPORTAMIENTO literal se promedia con su equivalente numérico
+COMPORTAMIENTO = REGLAS.comportamiento
+
+COLUMNAS_RESULTADO = ['DNI', 'Nombre', 'Tipo', 'Excepcion', 'Prom1a4', 'Prom1a5', 'AD', 'A', 'B', 'C', 'Documento', 'MinADyA']
+
+PERIODOS = REGLAS.periodos
+# Periodos que se evalúan según el último grado cursado
+PERIODOS_POR_GRADO = REGLAS.periodos_por_grado
+
+def normalizar_notas(df):
+    # Interpreta la columna NOTA una sola vez para todo el frame (uno o varios DNI):
+    # NOTA_NUM tiene el valor numérico y NOTA_LETRA la nota literal como categoría.
+    # Igual que antes, COMPORTAMIENTO literal se reemplaza en NOTA por su equivalente.
+    if 'NOTA_NUM' in df.columns:
+        return df
+    comportamiento = df['DESC'] == 'COMPORTAMIENTO'
+    df.loc[comportamiento, 'NOTA'] = df.loc[comportamiento, 'NOTA'].replace(COMPORTAMIENTO)
+    numero = pd.to_numeric(df['NOTA'], errors='coerce').astype(float)
+    df['NOTA_NUM'] = numero
+    df['NOTA_LETRA'] = pd.Categorical(df['NOTA'].where(numero.isna()), categories=LETRAS)
+    return df
+
+def tipo_por_dni(df):
+    grados = df.groupby('DNI')['GRADO'].nunique()
+    return grados.map({5: 'Egresado', 4: 'Escolar'}).fillna('-').rename('Tipo')
+
 def escolar_o_egresado(df):
     grados = df['GRADO'].unique()
     if len(grados) == 5:
@@ -165,129 +383,195 @@ def escolar_o_egresado(df):
         tipo = '-'
     return tipo
 
-def cumple_excepcion(df, minADA):
-    number = df['NOTA'].apply(lambda x: isinstance(x, (int, float)) or str(x).isdigit())
-    mismo_colegio = len(df['CODMOD'].unique()) == 1
-    if mismo_colegio:
-        prom = df.loc[number, 'NOTA'].astype(float).mean()
-    else:
-        prom = df.loc[number & df['GRADO'].isin(['3.°', '4.°', '5.°']), 'NOTA'].astype(float).mean()
-    counts = (df
-              .loc[~number, 'NOTA']
+def rasgos_excepcion(df):
+    # Lo que la excepción necesita de cada DNI, sin depender de minADA: cantidad de notas
+    # numéricas y literales, promedio de las numéricas consideradas y cantidad de AD y A.
+    # También devuelve la cantidad de cada nota literal
+    df = normalizar_notas(df)
+    dni = df['DNI']
+    numero = df['NOTA_NUM'].notna()
+    mismo_colegio = df.groupby('DNI')['CODMOD'].nunique(dropna=False) == 1
+    # Con cambio de colegio solo cuentan las notas de 3.° a 5.°
+    considerar = numero & (dni.map(mismo_colegio) | df['GRADO'].isin(REGLAS.grados_cambio_colegio))
+    prom = df['NOTA_NUM'].where(considerar).groupby(dni).mean()
+    numeros = numero.groupby(dni).sum()
+    letras = (~numero).groupby(dni).sum()
+    ad_y_a = df['NOTA_LETRA'].isin(['AD', 'A']).groupby(dni).sum()
+    rasgos = pd.DataFrame({'numeros': numeros, 'letras': letras, 'prom': prom, 'ad_y_a': ad_y_a})
+    counts = (df.loc[~numero, 'NOTA']
+              .groupby(dni[~numero])
               .value_counts()
               .rename('Cantidad')
-              .to_frame()
               .reset_index()
-              .rename(columns={'index': 'NOTA'}))
-    counts['DNI'] = df['DNI'].unique()[0]
-    if 'C' in df['NOTA']:
-        return 'No', counts
-    if number.sum() > (~number).sum():
-        return 'Sí' if prom >= 14 else 'No', counts
-    else:
-        ad_y_a = df[~number & df['NOTA'].isin(['AD', 'A'])].shape[0]
-        return 'Sí' if ad_y_a >= minADA else 'No', counts
+              .reindex(columns=['NOTA', 'Cantidad', 'DNI']))
+    return rasgos, counts
 
-def calcular_promedios(df):
-    comportamiento = {'AD': 20, 'A': 17, 'B': 15, 'C': 13}
-    df.loc[df['DESC'] == 'COMPORTAMIENTO', 'NOTA'] = (df.loc[df['DESC'] == 'COMPORTAMIENTO', 'NOTA'].map(lambda x: comportamiento[x] if isinstance(x, str) else x))
-    numeros = df[df['NOTA'].apply(lambda x: isinstance(x, (int, float)) or str(x).isdigit())]
-    numeros['NOTA'] = numeros['NOTA'].astype(float)
-    letras = df[~df['NOTA'].apply(lambda x: isinstance(x, (int, float)) or str(x).isdigit())]
-    equiv = {'AD': 4.0, 'A': 3.0, 'B': 2.5, 'C': 1.0}
-    letras['NOTA'] = letras['NOTA'].apply(lambda x: equiv[x])
-    Rnumeros = numeros.groupby(['DNI', 'GRADO', 'DESC'])['NOTA'].mean()
-    Rletras = (letras.groupby(['DNI', 'GRADO', 'DESC'], group_keys=False)['NOTA'].apply(lambda x: ((x.sum() / x.count()) * 10 / 4) * 1000).map(math.trunc) / 1000)
+def decidir_excepcion(rasgos, minADA):
+    return pd.Series(
+        np.where(
+            rasgos['numeros'] > rasgos['letras'],
+            np.where(rasgos['prom'] >= REGLAS.promedio_excepcion, 'Sí', 'No'),
+            np.where(rasgos['ad_y_a'] >= minADA, 'Sí', 'No')
+        ),
+        index=rasgos.index,
+        name='Excepcion'
+    )
+
+def cumple_excepcion_lote(df, minADA):
+    # Devuelve la excepción (Sí/No) por DNI y la cantidad de cada nota literal
+    rasgos, counts = rasgos_excepcion(df)
+    return decidir_excepcion(rasgos, minADA), counts
+
+def cumple_excepcion(df, minADA):
+    excepcion, counts = cumple_excepcion_lote(df, minADA)
+    return excepcion.iloc[0], counts
+
+def calcular_promedios_lote(df):
+    # Promedio por área y grado (notaR) y promedios de 1.° a 4.° y de 1.° a 5.° por DNI
+    df = normalizar_notas(df)
+    numero = df['NOTA_NUM'].notna()
+    desconocidas = ~numero & df['NOTA_LETRA'].isna()
+    if desconocidas.any():
+        raise ValueError(f"Nota no reconocida: {df.loc[desconocidas, 'NOTA'].iloc[0]}")
+    claves = ['DNI', 'GRADO', 'DESC']
+    Rnumeros = df[numero].groupby(claves)['NOTA_NUM'].mean()
+    letras = df.loc[~numero, claves].assign(NOTA=EQUIVALENCIAS[df.loc[~numero, 'NOTA_LETRA'].cat.codes])
+    Rletras = np.trunc(letras.groupby(claves)['NOTA'].mean() * 10 / 4 * 1000) / 1000
     Rletras = ((Rletras - 2.5) * 8 / 3)
-    if Rletras.empty:
-        notaR = Rnumeros
-    elif Rnumeros.empty:
-        notaR = Rletras
-    else:
-        notaR = pd.DataFrame(pd.concat([Rnumeros, Rletras]))
-    notaR = notaR.reset_index()
-    if '5.°' in notaR['GRADO'].unique():
-        prom1a5 = notaR['NOTA'].mean()
-    else:
-        prom1a5 = None
-    prom1a4 = notaR.loc[~notaR['GRADO'].isin(['5.°']), 'NOTA'].mean()
-    return prom1a4, prom1a5, notaR
+    notaR = pd.concat([Rnumeros, Rletras]).rename('NOTA').reset_index()
+    quinto = notaR['GRADO'] == '5.°'
+    promedios = pd.DataFrame({
+        'Prom1a4': notaR.loc[~quinto, 'NOTA'].groupby(notaR.loc[~quinto, 'DNI']).mean(),
+        'Prom1a5': notaR['NOTA'].groupby(notaR['DNI']).mean().where(quinto.groupby(notaR['DNI']).any()),
+    }).reindex(df['DNI'].unique())
+    return promedios, notaR
+
+def calcular_promedios(df):
+    promedios, notaR = calcular_promedios_lote(df)
+    prom1a4, prom1a5 = promedios.iloc[0] if len(promedios) else (np.nan, np.nan)
+    return prom1a4, None if pd.isna(prom1a5) else prom1a5, notaR
+
+def rasgos_periodos(df, grado_maximo=None):
+    # Porcentaje de AD y A y promedio de cada periodo de cada DNI, sin depender de la carrera.
+    # grado_maximo puede ser un valor o una serie indexada por DNI; si no se indica, se toma
+    # de la columna GRADO
+    df = normalizar_notas(df)
+    dni = df['DNI']
+    if grado_maximo is None:
+        grado_maximo = df['GRADO'].str.extract(r'(\d+)')[0].astype(int).groupby(dni).max()
+    elif not isinstance(grado_maximo, pd.Series):
+        grado_maximo = pd.Series(grado_maximo, index=dni.unique())
+    periodos = REGLAS.tabla_periodos
+    notas = (pd.DataFrame({
+                'DNI': dni,
+                'GRADO': df['GRADO'],
+                'GRADO_MAXIMO': dni.map(grado_maximo),
+                'NOTA_NUM': df['NOTA_NUM'],
+                'AD_A': df['NOTA_LETRA'].isin(['AD', 'A']),
+             })
+             .merge(periodos, on=['GRADO_MAXIMO', 'GRADO']))
+    resumen = (notas
+               .groupby(['DNI', 'PERIODO EVALUACIÓN'], observed=True)
+               .agg(total=('GRADO', 'size'), ad_a=('AD_A', 'sum'), promedio=('NOTA_NUM', 'mean'))
+               .reset_index())
+    return pd.DataFrame({
+        'DNI': resumen['DNI'],
+        'PERIODO EVALUACIÓN': resumen['PERIODO EVALUACIÓN'].astype(str),
+        # Si el estudiante tiene alguna nota literal, el periodo se evalúa por porcentaje de AD y A
+        'es_letras': resumen['DNI'].map(df['NOTA_NUM'].isna().groupby(dni).any()).astype(bool),
+        'porcentaje': resumen['ad_a'] / resumen['total'] * 100,
+        'promedio': resumen['promedio'],
+    })
+
+def decidir_periodos(rasgos, carrera):
+    return REGLAS.decidir_periodos(rasgos, [carrera]).drop(columns='MODALIDAD')
+
+def evaluar_periodos_lote(df, carrera, grado_maximo=None):
+    # Evalúa los periodos de todos los DNI del frame
+    return decidir_periodos(rasgos_periodos(df, grado_maximo), carrera)
+
+def evaluar_modalidades(df, modalidades=None, grado_maximo=None):
+    # Evalúa los periodos de todos los DNI del frame con varias modalidades (todas las de
+    # reglas.toml si no se indican) en una sola pasada; la columna MODALIDAD las distingue
+    return REGLAS.decidir_periodos(rasgos_periodos(df, grado_maximo), modalidades)
 
 def evaluar_periodos(df, carrera, es_letras, grado_maximo):
-    periodos_todos = {
-        "1RO A 4TO": ['1.°', '2.°', '3.°', '4.°'],
-        "1RO A 5TO": ['1.°', '2.°', '3.°', '4.°', '5.°'],
-        "3RO A 5TO": ['3.°', '4.°', '5.°']
-    }
-    periodos = {}
-    if carrera == "MEDICINA":
-        if grado_maximo == 4:
-            periodos["1RO A 4TO"] = periodos_todos["1RO A 4TO"]
-        elif grado_maximo == 5:
-            periodos["1RO A 4TO"] = periodos_todos["1RO A 4TO"]
-            periodos["1RO A 5TO"] = periodos_todos["1RO A 5TO"]
-            periodos["3RO A 5TO"] = periodos_todos["3RO A 5TO"]
-    else:
-        if grado_maximo == 4:
-            periodos["1RO A 4TO"] = periodos_todos["1RO A 4TO"]
-        elif grado_maximo == 5:
-            periodos["1RO A 4TO"] = periodos_todos["1RO A 4TO"]
-            periodos["1RO A 5TO"] = periodos_todos["1RO A 5TO"]
-            periodos["3RO A 5TO"] = periodos_todos["3RO A 5TO"]
-    
-    resultados = []
-    for periodo, grados in periodos.items():
-        notas = df[df['GRADO'].isin(grados)]
-        if notas.empty:
-            continue
-        if es_letras:
-            total_notas = len(notas)
-            ad_a = len(notas[notas['NOTA'].isin(['AD', 'A'])])
-            porcentaje_ad_a = (ad_a / total_notas) * 100 if total_notas > 0 else 0
-            estado = "CUMPLE" if porcentaje_ad_a >= 90 else "NO CUMPLE"
-            resultados.append({
-                "PERIODO EVALUACIÓN": periodo,
-                "PORCENTAJE CON NOTAS AD Y A": f"{porcentaje_ad_a:.2f}%",
-                "ESTADO": estado
-            })
-        else:
-            notas_numericas = notas['NOTA'].apply(lambda x: float(x) if isinstance(x, (int, float)) or str(x).isdigit() else None)
-            notas_numericas = notas_numericas.dropna()
-            promedio = notas_numericas.mean() if not notas_numericas.empty else None
-            if carrera == "MEDICINA":
-                estado = "CUMPLE" if promedio and promedio >= 16 else "NO CUMPLE"
-            else:
-                estado = "CUMPLE" if promedio and promedio >= 14 else "NO CUMPLE"
-            resultados.append({
-                "PERIODO EVALUACIÓN": periodo,
-                "PROMEDIO FINAL": f"{promedio:.2f}" if promedio is not None else "N/A",
-                "ESTADO": estado
-            })
-    return pd.DataFrame(resultados)
-
-def procesar(file, minADA, carrera):
-    global TEMP
-    dni, nombre, documento, df, grado_maximo = procesar_pdf(file, pwd=TEMP.name)
-    if isinstance(dni, str) and "No cumple con el requisito" in dni:
-        return dni, None, None, None, None, None
-    tipo = escolar_o_egresado(df)
-    prom1a4, prom1a5, notaR = calcular_promedios(df)
-    cumple, counts = cumple_excepcion(df, minADA)
-    es_letras = df['NOTA'].apply(lambda x: not (isinstance(x, (int, float)) or str(x).isdigit())).any()
-    periodos_resultados = evaluar_periodos(df, carrera, es_letras, grado_maximo)
-    periodos_resultados['DNI'] = dni
-    result = pd.Series({
+    resultados = evaluar_periodos_lote(df, carrera, grado_maximo)
+    if resultados.empty:
+        return pd.DataFrame()
+    medida = "PORCENTAJE CON NOTAS AD Y A" if es_letras else "PROMEDIO FINAL"
+    return resultados[["PERIODO EVALUACIÓN", medida, "ESTADO"]]
+
+def rasgos_estudiante(extraccion):
+    # Lo que se calcula una sola vez por estudiante: todo lo que no depende de minADA
+    # ni de la carrera. aplicar_reglas() arma con esto la salida de evaluar()
+    dni, nombre, documento, df, grado_maximo = extraccion
+    with medir('reglas'):
+        df = normalizar_notas(df.copy())
+        prom1a4, prom1a5, notaR = calcular_promedios(df)
+        excepcion, counts = rasgos_excepcion(df)
+        periodos = rasgos_periodos(df, grado_maximo)
+    base = pd.Series({
         'DNI': dni,
         'Nombre': nombre,
-        'Excepcion': cumple,
         'Prom1a4': prom1a4,
         'Prom1a5': prom1a5,
-        'Tipo': tipo,
+        'Tipo': escolar_o_egresado(df),
         'Documento': documento,
-        'MinADyA': minADA,
     })
     notas = counts.drop(columns='DNI').set_index('NOTA')['Cantidad'].rename(0)
-    result = pd.concat([result, notas], axis=0)
-    result = result.reindex(['DNI', 'Nombre', 'Tipo', 'Excepcion', 'Prom1a4', 'Prom1a5', 'AD', 'A', 'B', 'C', 'Documento', 'MinADyA'])
-    return result, df, counts, notaR, periodos_resultados, es_letras
+    return {
+        'base': pd.concat([base, notas], axis=0).reindex(COLUMNAS_RESULTADO),
+        'data': df.drop(columns=['NOTA_NUM', 'NOTA_LETRA']),
+        'counts': counts,
+        'notaR': notaR,
+        'excepcion': excepcion,
+        'periodos': periodos,
+        'es_letras': df['NOTA_NUM'].isna().any(),
+    }
+
+def aplicar_reglas(rasgos, minADA, carrera):
+    es_letras = rasgos['es_letras']
+    result = rasgos['base'].copy()
+    result['Excepcion'] = decidir_excepcion(rasgos['excepcion'], minADA).iloc[0]
+    result['MinADyA'] = minADA
+    periodos_resultados = decidir_periodos(rasgos['periodos'], carrera)
+    if periodos_resultados.empty:
+        periodos_resultados = pd.DataFrame()
+    else:
+        medida = "PORCENTAJE CON NOTAS AD Y A" if es_letras else "PROMEDIO FINAL"
+        periodos_resultados = periodos_resultados[["PERIODO EVALUACIÓN", medida, "ESTADO"]].copy()
+    periodos_resultados['DNI'] = result['DNI']
+    return result, rasgos['data'], rasgos['counts'], rasgos['notaR'], periodos_resultados, es_letras
+
+def evaluar(extraccion, minADA, carrera):
+    dni = extraccion[0]
+    if isinstance(dni, str) and "No cumple con el requisito" in dni:
+        return dni, None, None, None, None, None
+    return aplicar_reglas(rasgos_estudiante(extraccion), minADA, carrera)
+
+def evaluar_lote(extracciones, minADA, carrera):
+    # Evalúa las reglas de varios estudiantes en una sola pasada sobre el frame combinado.
+    # Devuelve las tablas results, data, counts, promedios y periodos de Resultados;
+    # las extracciones que no cumplen el requisito de egreso se omiten
+    validas = [e for e in extracciones if not (isinstance(e[0], str) and "No cumple con el requisito" in e[0])]
+    if not validas:
+        return pd.DataFrame(columns=COLUMNAS_RESULTADO), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+    info = (pd.DataFrame([(e[0], e[1], e[2], e[4]) for e in validas], columns=['DNI', 'Nombre', 'Documento', 'GRADO_MAXIMO'])
+            .drop_duplicates('DNI', keep='last')
+            .set_index('DNI'))
+    with medir('reglas_lote'):
+        df = normalizar_notas(pd.concat([e[3] for e in validas], ignore_index=True))
+        promedios, notaR = calcular_promedios_lote(df)
+        excepcion, counts = cumple_excepcion_lote(df, minADA)
+        periodos = evaluar_periodos_lote(df, carrera, info['GRADO_MAXIMO'])
+    cantidades = counts.pivot(index='DNI', columns='NOTA', values='Cantidad')
+    results = (info
+               .join([tipo_por_dni(df), excepcion, promedios, cantidades])
+               .assign(MinADyA=minADA)
+               .reset_index()
+               .reindex(columns=COLUMNAS_RESULTADO))
+    return results, df.drop(columns=['NOTA_NUM', 'NOTA_LETRA']), counts, notaR, periodos
 
+def procesar(file, minADA, carrera, pwd=None):
+    return evaluar(procesar_pdf(file, pwd=pwd), minADA, carrera)
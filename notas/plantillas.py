@@ -0,0 +1,111 @@
+import os
+import json
+import tempfile
+import threading
+from .cache import CACHE_DIR
+from .notas import CONTADORES, unir_tablas
+from .texto import leer_paginas, es_grilla, _agrupar, _tabla
+
+# Caché de plantillas de tabla para camelot. Los COE y CLA de MINEDU usan casi siempre el
+# mismo diseño: la primera vez que aparece una geometría de página (documento, tamaño y
+# posición de las líneas verticales de cada tabla) se guardan los límites de columna que
+# detectó camelot y el encabezado de cada tabla. Los documentos siguientes con la misma
+# huella se leen directamente sobre esa grilla (filas según las líneas horizontales de la
+# página y texto de pdfminer, como el motor de texto), sin rasterizar la página ni buscar
+# las líneas con OpenCV. Si la lectura no coincide se vuelve a la detección completa.
+# Una plantilla solo se guarda si leer con ella reproduce exactamente la tabla de camelot.
+
+PLANTILLAS_ARCHIVO = os.environ.get('NOTAS_PLANTILLAS', os.path.join(CACHE_DIR, 'plantillas.json'))
+
+def huella(documento, ancho, alto, partes):
+    verticales = [','.join(str(round(x)) for x in _agrupar([v[0] for v in vs])) for _, vs, _ in partes]
+    return f"{documento}|{round(ancho)}x{round(alto)}|{';'.join(verticales)}"
+
+def _leer(plantilla, partes):
+    # Tablas de una página con su plantilla; ValueError si la página no corresponde
+    if len(partes) != len(plantilla):
+        raise ValueError('Cantidad de tablas distinta de la plantilla')
+    tablas = []
+    for (horizontales, verticales, textos), tabla in zip(partes, plantilla):
+        df = _tabla(horizontales, verticales, textos, xs=tabla['columnas'])
+        if df is None or df.iloc[:len(tabla['encabezado']), 0].tolist() != tabla['encabezado']:
+            raise ValueError('Encabezado distinto de la plantilla')
+        tablas.append(df)
+    return tablas
+
+class CachePlantillas:
+    # Plantillas por huella en un archivo JSON compartido por los procesos y las ejecuciones
+
+    def __init__(self, ruta=PLANTILLAS_ARCHIVO):
+        self.ruta = ruta
+        self._plantillas = None
+        self._lock = threading.Lock()
+
+    def _cargar(self):
+        if self._plantillas is None:
+            try:
+                with open(self.ruta, encoding='utf-8') as f:
+                    self._plantillas = json.load(f)
+            except (OSError, ValueError):
+                self._plantillas = {}
+        return self._plantillas
+
+    def obtener(self, clave):
+        return self._cargar().get(clave)
+
+    def guardar(self, nuevas):
+        with self._lock:
+            # Se vuelve a leer el archivo por si otro proceso agregó plantillas
+            self._plantillas = None
+            plantillas = self._cargar()
+            plantillas.update(nuevas)
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            fd, temporal = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.ruta)), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(plantillas, f, ensure_ascii=False)
+            os.replace(temporal, self.ruta)
+
+    def leer(self, pdf, paginas, documento):
+        # Devuelve (geometría, tabla unida); la tabla es None si alguna página no tiene
+        # plantilla o no coincide con ella. La geometría sirve luego para aprender()
+        geometria = []
+        for numero, ancho, alto, partes in leer_paginas(pdf, paginas):
+            partes = [p for p in partes if es_grilla(p[0], p[1])]
+            geometria.append((numero, huella(documento, ancho, alto, partes), partes))
+        plantillas = [self.obtener(clave) for _, clave, _ in geometria]
+        if not geometria or not all(plantillas):
+            CONTADORES['plantilla_nueva'] += 1
+            return geometria, None
+        try:
+            tablas = [t for (_, _, partes), plantilla in zip(geometria, plantillas) for t in _leer(plantilla, partes)]
+            res = unir_tablas(tablas)
+        except MemoryError:
+            # Sin memoria no se intenta además la detección completa con camelot
+            raise
+        except Exception:
+            CONTADORES['plantilla_descartada'] += 1
+            return geometria, None
+        CONTADORES['plantilla_acierto'] += 1
+        return geometria, res
+
+    def aprender(self, geometria, tables):
+        # tables: las tablas de camelot (lattice) del mismo documento
+        nuevas = {}
+        for numero, clave, partes in geometria:
+            detectadas = sorted((t for t in tables if t.page == numero), key=lambda t: t.order)
+            if not detectadas or len(detectadas) != len(partes):
+                continue
+            plantilla = [
+                {'columnas': [c[0] for c in t.cols] + [t.cols[-1][1]], 'encabezado': t.df.iloc[:3, 0].tolist()}
+                for t in detectadas
+            ]
+            try:
+                leidas = _leer(plantilla, partes)
+            except ValueError:
+                continue
+            if all(a.shape == t.df.shape and (a.values == t.df.values).all() for a, t in zip(leidas, detectadas)):
+                nuevas[clave] = plantilla
+        if nuevas:
+            self.guardar(nuevas)
+
+PLANTILLAS = CachePlantillas()
@@ -0,0 +1,78 @@
+import os
+import tomllib
+import numpy as np
+import pandas as pd
+
+# Reglas de admisión declaradas en reglas.toml y compiladas una sola vez en tablas y
+# umbrales que se aplican con operaciones vectorizadas a muchos estudiantes a la vez.
+# Las modalidades forman una tabla: evaluar una cohorte con varias de ellas es un solo
+# cruce de los rasgos de los periodos con esa tabla.
+
+REGLAS_TOML = os.environ.get('NOTAS_REGLAS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reglas.toml'))
+
+class Reglas:
+
+    def __init__(self, config):
+        try:
+            self.letras = list(config['equivalencias'])
+            self.equivalencias = np.array([float(v) for v in config['equivalencias'].values()])
+            self.comportamiento = dict(config['comportamiento'])
+            self.periodos = {nombre: list(grados) for nombre, grados in config['periodos'].items()}
+            self.periodos_por_grado = {int(g): list(nombres) for g, nombres in config['periodos_por_grado'].items()}
+            excepcion = config['excepcion']
+            self.promedio_excepcion = float(excepcion['promedio_minimo'])
+            self.grados_cambio_colegio = list(excepcion['grados_cambio_colegio'])
+            self.minimo_ad_a = int(excepcion['minimo_ad_a'])
+            self.modalidades = (pd.DataFrame.from_dict(config['modalidades'], orient='index')
+                                .reindex(columns=['promedio_minimo', 'porcentaje_ad_a'])
+                                .astype(float)
+                                .rename_axis('MODALIDAD'))
+            self.por_defecto = config['modalidad_por_defecto']
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f'Configuración de reglas incompleta o inválida: {e}') from e
+        if self.modalidades.isna().any().any():
+            raise ValueError('Cada modalidad debe indicar promedio_minimo y porcentaje_ad_a')
+        if self.por_defecto not in self.modalidades.index:
+            raise ValueError(f'La modalidad por defecto no existe: {self.por_defecto}')
+        for nombres in self.periodos_por_grado.values():
+            for nombre in nombres:
+                if nombre not in self.periodos:
+                    raise ValueError(f'Periodo no definido: {nombre}')
+        # Tabla (último grado, periodo, grado) que se une a las notas en rasgos_periodos
+        self.tabla_periodos = pd.DataFrame(
+            [(g, periodo, grado)
+             for g, nombres in self.periodos_por_grado.items()
+             for periodo in nombres
+             for grado in self.periodos[periodo]],
+            columns=['GRADO_MAXIMO', 'PERIODO EVALUACIÓN', 'GRADO']
+        )
+        self.tabla_periodos['PERIODO EVALUACIÓN'] = pd.Categorical(
+            self.tabla_periodos['PERIODO EVALUACIÓN'], categories=list(self.periodos)
+        )
+
+    def modalidad(self, carrera):
+        return carrera if carrera in self.modalidades.index else self.por_defecto
+
+    def decidir_periodos(self, rasgos, modalidades=None):
+        # rasgos: salida de rasgos_periodos. Devuelve una fila por periodo, estudiante y
+        # modalidad (todas si no se indican), en una sola pasada
+        if modalidades is None:
+            modalidades = list(self.modalidades.index)
+        tabla = self.modalidades.loc[[self.modalidad(m) for m in modalidades]].reset_index()
+        cruce = rasgos.merge(tabla, how='cross')
+        es_letras = cruce['es_letras']
+        porcentaje = cruce['porcentaje']
+        promedio = cruce['promedio']
+        cumple = np.where(es_letras, porcentaje >= cruce['porcentaje_ad_a'], promedio >= cruce['promedio_minimo'])
+        return pd.DataFrame({
+            'PERIODO EVALUACIÓN': cruce['PERIODO EVALUACIÓN'],
+            'PROMEDIO FINAL': promedio.map('{:.2f}'.format).where(promedio.notna(), 'N/A').where(~es_letras),
+            'PORCENTAJE CON NOTAS AD Y A': porcentaje.map('{:.2f}%'.format).where(es_letras),
+            'ESTADO': np.where(cumple, 'CUMPLE', 'NO CUMPLE'),
+            'DNI': cruce['DNI'],
+            'MODALIDAD': cruce['MODALIDAD'],
+        })
+
+def cargar_reglas(ruta=REGLAS_TOML):
+    with open(ruta, 'rb') as f:
+        return Reglas(tomllib.load(f))
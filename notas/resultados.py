@@ -0,0 +1,67 @@
+import pandas as pd
+from .compacto import compactar, concatenar
+
+class Resultados:
+    # Acumula los resultados por archivo en listas y arma cada tabla una sola vez,
+    # en lugar de copiar todo lo acumulado con pd.concat en cada iteración.
+    # Las notas (data) se guardan compactadas; compacto.expandir las devuelve a su forma original
+
+    TABLAS = ['results', 'data', 'counts', 'promedios', 'periodos']
+
+    def __init__(self):
+        self._partes = {tabla: [] for tabla in self.TABLAS}
+        self._tablas = {}
+        self._indices = {}
+        self.ultimo_dni = None
+
+    def agregar(self, result, data, count, notaR, periodos):
+        self._partes['results'].append(result.to_frame().T)
+        self._partes['data'].append(compactar(data))
+        self._partes['counts'].append(count)
+        self._partes['promedios'].append(notaR)
+        self._partes['periodos'].append(periodos)
+        self.ultimo_dni = result['DNI']
+        self._tablas.clear()
+        self._indices.clear()
+
+    def __len__(self):
+        return len(self._partes['results'])
+
+    def tabla(self, nombre):
+        if nombre not in self._tablas:
+            partes = self._partes[nombre]
+            if nombre == 'data':
+                self._tablas[nombre] = concatenar(partes)
+            else:
+                self._tablas[nombre] = pd.concat(partes, axis=0, ignore_index=True) if partes else pd.DataFrame()
+        return self._tablas[nombre]
+
+    @property
+    def results(self):
+        return self.tabla('results')
+
+    @property
+    def data(self):
+        return self.tabla('data')
+
+    @property
+    def counts(self):
+        return self.tabla('counts')
+
+    @property
+    def promedios(self):
+        return self.tabla('promedios')
+
+    @property
+    def periodos(self):
+        return self.tabla('periodos')
+
+    def por_dni(self, nombre, dni):
+        # Las posiciones de cada DNI se calculan una vez por tabla; luego cada consulta
+        # es un acceso directo en lugar de recorrer la tabla con query
+        df = self.tabla(nombre)
+        if 'DNI' not in df.columns:
+            return df.iloc[0:0]
+        if nombre not in self._indices:
+            self._indices[nombre] = df.groupby('DNI', sort=False, observed=True).indices
+        return df.iloc[self._indices[nombre].get(dni, [])]
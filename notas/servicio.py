@@ -0,0 +1,230 @@
+import io
+import sys
+import json
+import asyncio
+import argparse
+from concurrent.futures.process import BrokenProcessPool
+import tornado.web
+import tornado.iostream
+from tornado.ioloop import IOLoop
+from .almacen import Almacen
+from .cache import cache_por_defecto
+from .cli import CARRERAS, listar_pdfs
+from .duplicados import Deduplicador
+from .lote import Trabajadores, extraer_aislado, _evaluar, EN_CURSO_POR_TRABAJADOR
+from .notas import CONTADORES, REGLAS
+from . import metricas
+
+# Servicio HTTP para que otros sistemas evalúen certificados sin pasar por la aplicación web:
+#   POST /evaluate         uno o varios PDF (multipart, o el PDF/ZIP como cuerpo); la respuesta
+#                          es NDJSON con una línea por archivo, en el orden en que terminan
+#   GET  /results/{dni}    evaluaciones guardadas del DNI
+# La extracción corre en el mismo pool de procesos que el lote y la cola de la aplicación, con
+# un límite de archivos en curso compartido por todas las solicitudes; las reglas se evalúan
+# aquí y cada resultado queda en el Almacen, igual que en la aplicación.
+
+class Servicio:
+    # Estado compartido por los handlers: pool, caché de extracciones y almacén
+
+    def __init__(self, max_workers=None, cache=None, almacen=None):
+        self.trabajadores = Trabajadores(max_workers)
+        self.cache = cache or cache_por_defecto()
+        self.almacen = almacen or Almacen()
+        self.lugares = asyncio.Semaphore(self.trabajadores.max_workers * EN_CURSO_POR_TRABAJADOR)
+
+    async def extraer(self, clave, nombre, datos):
+        # Devuelve la salida de _extraer_archivo: (indice, nombre, extracción, error)
+        loop = IOLoop.current()
+        extraccion = await loop.run_in_executor(None, self.cache.obtener, clave)
+        if extraccion is not None:
+            return 0, nombre, extraccion, None
+        medir = metricas.activas()
+        async with self.lugares:
+            pool, futuro = self.trabajadores.enviar(0, nombre, datos, self.cache, medir)
+            try:
+                salida, contadores, tiempos = await asyncio.wrap_future(futuro)
+            except BrokenProcessPool:
+                # Un trabajador murió y con él todo lo que estaba en curso: la siguiente
+                # extracción usa un pool nuevo y este archivo se reintenta solo
+                self.trabajadores.descartar(pool)
+                salida, contadores, tiempos = await loop.run_in_executor(
+                    None, extraer_aislado, 0, nombre, datos, self.cache, medir
+                )
+        CONTADORES.update(contadores)
+        metricas.combinar(tiempos)
+        return salida
+
+    def evaluar(self, clave, salida, minADA, carrera):
+        # Reglas y almacén, fuera del hilo del servidor
+        _, nombre, resultado, error = _evaluar(salida, minADA, carrera)
+        if error is None and isinstance(resultado[0], str):
+            return respuesta(nombre, clave, 'no cumple', error=resultado[0])
+        if error is not None:
+            return respuesta(nombre, clave, 'error', error=error)
+        self.almacen.guardar(clave, resultado, carrera)
+        result, _, _, _, periodos, _ = resultado
+        result = json.loads(result.to_json(force_ascii=False))
+        return respuesta(
+            nombre, clave, 'evaluado', dni=result['DNI'], resultado=result,
+            periodos=registros(periodos.drop(columns='DNI').dropna(axis=1, how='all')),
+        )
+
+    async def procesar(self, clave, nombre, datos, minADA, carrera):
+        # Siempre devuelve la línea del archivo: un error no corta la respuesta de los demás
+        try:
+            salida = await self.extraer(clave, nombre, datos)
+            return await IOLoop.current().run_in_executor(None, self.evaluar, clave, salida, minADA, carrera)
+        except Exception as e:
+            return respuesta(nombre, clave, 'error', error=str(e))
+
+    def cerrar(self):
+        self.trabajadores.cerrar(esperar=False)
+
+def registros(df):
+    return json.loads(df.to_json(orient='records', force_ascii=False))
+
+def respuesta(archivo, clave, estado, **campos):
+    return {'archivo': archivo, 'clave': clave, 'estado': estado, **campos}
+
+def es_zip(datos):
+    return datos[:4] == b'PK\x03\x04'
+
+def archivos_de(request):
+    # Pares (nombre, bytes) de la solicitud; los ZIP se expanden en sus PDF
+    if request.files:
+        subidos = [(f['filename'], f['body']) for archivos in request.files.values() for f in archivos]
+    else:
+        defecto = 'archivo.zip' if es_zip(request.body) else 'archivo.pdf'
+        nombre = request.query_arguments.get('nombre', [defecto.encode()])[0].decode()
+        subidos = [(nombre, request.body)] if request.body else []
+    archivos = []
+    for nombre, datos in subidos:
+        if es_zip(datos):
+            archivos.extend((f'{nombre}/{interno}', leer()) for interno, leer in listar_pdfs(io.BytesIO(datos)))
+        else:
+            archivos.append((nombre, datos))
+    return archivos
+
+def revisar_duplicados(dedup, archivos):
+    # Las copias de un certificado de la misma solicitud no se procesan dos veces. Devuelve
+    # (clave, nombre, datos, huella) de los archivos (nombre, datos, clave o None) a procesar;
+    # otro escaneo del mismo certificado queda retenido en dedup hasta que termine el original
+    unicos = []
+    for nombre, datos, clave in archivos:
+        nuevo = dedup.revisar(nombre, datos, clave)
+        if nuevo is not None:
+            unicos.append((nuevo[0], nombre, datos, nuevo[1]))
+    return unicos
+
+
+class ManejadorBase(tornado.web.RequestHandler):
+
+    def initialize(self, servicio):
+        self.servicio = servicio
+
+    def write_error(self, status_code, **kwargs):
+        self.set_header('Content-Type', 'application/json; charset=utf-8')
+        self.finish(json.dumps({'error': self._reason}, ensure_ascii=False))
+
+    def escribir_json(self, datos):
+        self.set_header('Content-Type', 'application/json; charset=utf-8')
+        self.finish(json.dumps(datos, ensure_ascii=False))
+
+class ManejadorEvaluar(ManejadorBase):
+
+    async def post(self):
+        carrera = self.get_argument('carrera', 'MEDICINA')
+        if carrera not in CARRERAS:
+            raise tornado.web.HTTPError(400, reason=f'Carrera desconocida: {carrera}')
+        try:
+            minADA = int(self.get_argument('min_ada', str(REGLAS.minimo_ad_a)))
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason='min_ada debe ser un número entero')
+        loop = IOLoop.current()
+        archivos = await loop.run_in_executor(None, archivos_de, self.request)
+        if not archivos:
+            raise tornado.web.HTTPError(400, reason='La solicitud no contiene archivos PDF')
+        dedup = Deduplicador(esperar_original=True)
+        unicos = await loop.run_in_executor(
+            None, revisar_duplicados, dedup, [(nombre, datos, None) for nombre, datos in archivos]
+        )
+        self.set_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        # tarea -> huella del archivo que procesa
+        tareas = {}
+        informados = 0
+        try:
+            while True:
+                for clave, nombre, datos, huella in unicos:
+                    tarea = asyncio.ensure_future(self.servicio.procesar(clave, nombre, datos, minADA, CARRERAS[carrera]))
+                    tareas[tarea] = huella
+                for archivo, original, motivo in dedup.duplicados[informados:]:
+                    await self.enviar(respuesta(archivo, None, 'duplicado', original=original, error=motivo))
+                informados = len(dedup.duplicados)
+                if not tareas:
+                    break
+                hechos, _ = await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+                retenidos = []
+                for tarea in hechos:
+                    huella = tareas.pop(tarea)
+                    linea = tarea.result()
+                    await self.enviar(linea)
+                    if huella is not None:
+                        # Los escaneos retenidos se informan como duplicados si el original se
+                        # evaluó; si no, se revisan de nuevo y el siguiente se procesa
+                        retenidos.extend(dedup.resolver(huella, linea['estado'] == 'evaluado'))
+                # Las huellas de los retenidos ya están calculadas: no se vuelven a leer los PDF
+                unicos = revisar_duplicados(dedup, retenidos)
+        except tornado.iostream.StreamClosedError:
+            # El cliente se desconectó: lo que ya se extrajo queda en la caché y en el almacén
+            return
+        finally:
+            metricas.exportar(contadores=CONTADORES)
+        self.finish()
+
+    async def enviar(self, linea):
+        self.write(json.dumps(linea, ensure_ascii=False) + '\n')
+        await self.flush()
+
+class ManejadorResultados(ManejadorBase):
+
+    async def get(self, dni):
+        consulta = await IOLoop.current().run_in_executor(None, self.servicio.almacen.consultar_dni, dni)
+        if consulta['results'].empty:
+            raise tornado.web.HTTPError(404, reason=f'No hay evaluaciones guardadas para el DNI {dni}')
+        self.escribir_json({'dni': dni, **{tabla: registros(df) for tabla, df in consulta.items()}})
+
+
+def crear_aplicacion(servicio=None):
+    servicio = servicio or Servicio()
+    return tornado.web.Application([
+        (r'/evaluate', ManejadorEvaluar, {'servicio': servicio}),
+        (r'/results/([^/]+)', ManejadorResultados, {'servicio': servicio}),
+    ])
+
+async def servir(direccion, puerto, max_workers=None, max_mb=100):
+    servicio = Servicio(max_workers)
+    servidor = crear_aplicacion(servicio).listen(puerto, address=direccion, max_body_size=max_mb * 1024 * 1024)
+    print(f'Escuchando en http://{direccion}:{puerto}', file=sys.stderr)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        servidor.stop()
+        servicio.cerrar()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m notas.servicio',
+        description='Servicio HTTP para evaluar certificados COE/CLA y consultar resultados por DNI.'
+    )
+    parser.add_argument('--direccion', default='127.0.0.1', help='Dirección donde escuchar (por defecto: 127.0.0.1)')
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=None, help='Cantidad de procesos')
+    parser.add_argument('--max-mb', type=int, default=100, help='Tamaño máximo de una solicitud, en MB')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(servir(args.direccion, args.puerto, args.workers, args.max_mb))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
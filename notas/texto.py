@@ -0,0 +1,126 @@
+import pandas as pd
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LAParams, LTCurve, LTTextContainer, LTTextLineHorizontal
+
+# Motor de extracción alternativo a camelot: reconstruye la grilla de la tabla a partir
+# de las líneas vectoriales y del texto posicionado de pdfminer, sin rasterizar la página
+# ni usar OpenCV. Devuelve las tablas con la misma forma que camelot (t.df), de modo que
+# el resto del proceso (procesar_tabla) es común a ambos motores.
+
+# Mismos parámetros de pdfminer que usa camelot para que las líneas de texto coincidan
+LAPARAMS = LAParams(char_margin=1.0, line_margin=0.5, word_margin=0.1, detect_vertical=True, all_texts=True)
+TOL = 2
+
+def _agrupar(valores):
+    # Une coordenadas que difieren menos que la tolerancia
+    grupos = []
+    for v in sorted(valores):
+        if grupos and v - grupos[-1][-1] <= TOL:
+            grupos[-1].append(v)
+        else:
+            grupos.append([v])
+    return [sum(g) / len(g) for g in grupos]
+
+def _objetos(layout):
+    for obj in layout:
+        if isinstance(obj, LTTextLineHorizontal):
+            yield obj
+        elif isinstance(obj, LTTextContainer) or hasattr(obj, '_objs'):
+            yield from _objetos(obj)
+        else:
+            yield obj
+
+def _segmentos(objetos):
+    horizontales, verticales = [], []
+    for obj in objetos:
+        if not isinstance(obj, LTCurve):  # LTRect y LTLine heredan de LTCurve
+            continue
+        x0, y0, x1, y1 = obj.bbox
+        if y1 - y0 <= TOL:
+            horizontales.append(((y0 + y1) / 2, x0, x1))
+        elif x1 - x0 <= TOL:
+            verticales.append(((x0 + x1) / 2, y0, y1))
+        else:
+            # Rectángulo: se toman sus cuatro bordes
+            horizontales += [(y0, x0, x1), (y1, x0, x1)]
+            verticales += [(x0, y0, y1), (x1, y0, y1)]
+    return horizontales, verticales
+
+def _rangos_de_tablas(verticales):
+    # Cada tabla ocupa un tramo vertical continuo cubierto por sus bordes verticales
+    rangos = []
+    for _, y0, y1 in sorted(verticales, key=lambda v: v[1]):
+        if rangos and y0 <= rangos[-1][1] + TOL:
+            rangos[-1][1] = max(rangos[-1][1], y1)
+        else:
+            rangos.append([y0, y1])
+    return sorted(rangos, key=lambda r: -r[1])
+
+def _cubre(segmentos, pos, medio):
+    return any(abs(p - pos) <= TOL and a - TOL <= medio <= b + TOL for p, a, b in segmentos)
+
+def _bordes(horizontales, verticales, rows, cols):
+    # Bordes de cada celda: arriba e izquierda (los de abajo y derecha son los del vecino)
+    arriba = [[r == 0 or _cubre(horizontales, top, (c0 + c1) / 2) for c0, c1 in cols] for r, (top, _) in enumerate(rows)]
+    izquierda = [[c == 0 or _cubre(verticales, c0, (top + bottom) / 2) for c, (c0, _) in enumerate(cols)] for top, bottom in rows]
+    return arriba, izquierda
+
+def es_grilla(horizontales, verticales):
+    # Un recuadro suelto (leyendas, firmas) no es una tabla de notas
+    return len(_agrupar([h[0] for h in horizontales])) >= 3 and len(_agrupar([v[0] for v in verticales])) >= 3
+
+def _tabla(horizontales, verticales, textos, xs=None):
+    # xs: límites de las columnas, si ya se conocen (plantillas); si no, las líneas verticales
+    if not es_grilla(horizontales, verticales):
+        return None
+    ys = sorted(_agrupar([h[0] for h in horizontales]), reverse=True)
+    xs = xs or _agrupar([v[0] for v in verticales])
+    rows = list(zip(ys[:-1], ys[1:]))
+    cols = list(zip(xs[:-1], xs[1:]))
+    arriba, izquierda = _bordes(horizontales, verticales, rows, cols)
+    celdas = [['' for _ in cols] for _ in rows]
+    for t in sorted(textos, key=lambda t: (-t.y0, t.x0)):
+        medio = (t.y0 + t.y1) / 2
+        r = next((i for i, (top, bottom) in enumerate(rows) if bottom < medio < top), None)
+        if r is None:
+            continue
+        solape = [
+            (min(t.x1, c1) - max(t.x0, c0)) / (c1 - c0) if c0 <= t.x1 and c1 >= t.x0 else -1
+            for c0, c1 in cols
+        ]
+        c = solape.index(max(solape))
+        # Igual que camelot (shift_text=['l', 't']): el texto de una celda combinada
+        # queda en su esquina superior izquierda
+        while not izquierda[r][c]:
+            c -= 1
+        while not arriba[r][c]:
+            r -= 1
+        celdas[r][c] += t.get_text().replace('\n', '')
+    return pd.DataFrame(celdas)
+
+def leer_paginas(pdf, paginas=None):
+    # paginas: números de página desde 1, como en camelot. Devuelve por cada página su
+    # número, su tamaño y, por cada tabla, sus líneas horizontales y verticales y sus textos
+    numeros = [p - 1 for p in paginas] if paginas else None
+    for i, layout in enumerate(extract_pages(pdf, page_numbers=numeros, laparams=LAPARAMS)):
+        objetos = list(_objetos(layout))
+        textos = [o for o in objetos if isinstance(o, LTTextLineHorizontal) and o.get_text().strip()]
+        horizontales, verticales = _segmentos(objetos)
+        partes = []
+        for y0, y1 in _rangos_de_tablas(verticales):
+            dentro = lambda a, b: a >= y0 - TOL and b <= y1 + TOL
+            partes.append((
+                [h for h in horizontales if dentro(h[0], h[0])],
+                [v for v in verticales if dentro(v[1], v[2])],
+                [t for t in textos if dentro((t.y0 + t.y1) / 2, (t.y0 + t.y1) / 2)],
+            ))
+        yield paginas[i] if paginas else i + 1, layout.width, layout.height, partes
+
+def leer_tablas_texto(pdf, paginas=None):
+    tablas = []
+    for _, _, _, partes in leer_paginas(pdf, paginas):
+        for horizontales, verticales, textos in partes:
+            tabla = _tabla(horizontales, verticales, textos)
+            if tabla is not None:
+                tablas.append(tabla)
+    return tablas
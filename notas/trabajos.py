@@ -0,0 +1,148 @@
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from .notas import CONTADORES
+from .cache import CACHE_DIR, hash_pdf, cache_por_defecto
+from .lote import Trabajadores, extraer_aislado, EN_CURSO_POR_TRABAJADOR
+from . import metricas
+
+# Cola de trabajos en segundo plano: cada PDF se registra en SQLite por el SHA-256 de su
+# contenido y se extrae en un pool de procesos; la extracción queda en la caché de Parquet.
+# Quien encola no espera: consulta el estado y usa lo que ya esté listo.
+TRABAJOS_DB = os.environ.get('NOTAS_TRABAJOS_DB', os.path.join(CACHE_DIR, 'trabajos.sqlite3'))
+# Segundos durante los que un archivo que falló no se vuelve a intentar al recargar la página
+# (NOTAS_REINTENTAR_ERRORES); volver a cargarlo lo reintenta siempre
+REINTENTAR_ERRORES = int(os.environ.get('NOTAS_REINTENTAR_ERRORES', 900))
+
+PENDIENTE = 'pendiente'
+ESPERA = 'espera'
+LISTO = 'listo'
+ERROR = 'error'
+
+class ColaTrabajos:
+
+    def __init__(self, ruta=TRABAJOS_DB, cache=None, max_workers=None, max_en_curso=None):
+        self.ruta = ruta
+        self.cache = cache or cache_por_defecto()
+        self.trabajadores = Trabajadores(max_workers)
+        # Los que exceden EN_CURSO_POR_TRABAJADOR quedan en espera (sin guardar sus bytes) y se
+        # vuelven a encolar en la siguiente consulta
+        self.max_en_curso = max_en_curso or self.trabajadores.max_workers * EN_CURSO_POR_TRABAJADOR
+        self._lock = threading.Lock()
+        self._en_curso = set()
+        # Reintentos de a uno de los archivos que estaban en curso cuando murió un trabajador
+        self._aislados = ThreadPoolExecutor(max_workers=1)
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        with self._conectar() as conn:
+            # WAL permite que varias instancias de la aplicación lean mientras otra escribe
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS trabajos (
+                    clave TEXT PRIMARY KEY,
+                    nombre TEXT,
+                    estado TEXT NOT NULL,
+                    error TEXT,
+                    creado REAL,
+                    actualizado REAL
+                )
+            """)
+
+    def _conectar(self):
+        # Una conexión por operación: se usa desde el hilo de la interfaz y desde los callbacks del pool
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    def _actualizar(self, clave, nombre, estado, error=None):
+        ahora = time.time()
+        with self._conectar() as conn:
+            conn.execute("""
+                INSERT INTO trabajos (clave, nombre, estado, error, creado, actualizado)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(clave) DO UPDATE SET estado = excluded.estado, error = excluded.error,
+                                                 actualizado = excluded.actualizado
+            """, (clave, nombre, estado, error, ahora, ahora))
+
+    def _error_reciente(self, clave):
+        with self._conectar() as conn:
+            fila = conn.execute('SELECT estado, actualizado FROM trabajos WHERE clave = ?', (clave,)).fetchone()
+        return fila is not None and fila[0] == ERROR and time.time() - fila[1] < REINTENTAR_ERRORES
+
+    def encolar(self, nombre, datos, reintentar=False):
+        # Devuelve la clave del trabajo; si la extracción ya está en la caché no se vuelve a procesar.
+        # Si hay demasiados archivos en proceso queda en espera: quien encola debe volver a
+        # llamar a encolar() mientras el estado sea ESPERA.
+        # reintentar: el archivo se cargó de nuevo, se procesa aunque haya fallado hace poco
+        clave = hash_pdf(datos)
+        if os.path.exists(self.cache._ruta(clave)):
+            self._actualizar(clave, nombre, LISTO)
+            return clave
+        with self._lock:
+            if clave in self._en_curso:
+                return clave
+            # Un archivo que falló no se reintenta en cada recarga de la página
+            if not reintentar and self._error_reciente(clave):
+                return clave
+            en_espera = len(self._en_curso) >= self.max_en_curso
+            if not en_espera:
+                self._en_curso.add(clave)
+        if en_espera:
+            CONTADORES['en_espera'] += 1
+            self._actualizar(clave, nombre, ESPERA)
+            return clave
+        self._actualizar(clave, nombre, PENDIENTE)
+        medir = metricas.activas()
+        pool, futuro = self.trabajadores.enviar(0, nombre, datos, self.cache, medir)
+        futuro.add_done_callback(lambda f: self._terminar(clave, nombre, f, pool, datos, medir))
+        return clave
+
+    def _terminar(self, clave, nombre, futuro, pool, datos, medir):
+        try:
+            resultado = futuro.result()
+        except BrokenProcessPool:
+            # Un trabajador murió (por ejemplo, lo terminó el sistema por falta de memoria):
+            # el pool ya no sirve y el siguiente encolar() crea otro. Fallan todos los archivos
+            # en curso, no solo el que lo causó: cada uno se reintenta solo y sigue pendiente
+            self.trabajadores.descartar(pool)
+            CONTADORES['reintento_aislado'] += 1
+            self._aislados.submit(self._reintentar, clave, nombre, datos, medir)
+            return
+        except Exception as e:
+            resultado = (None, None, None, str(e)), None, None
+        self._finalizar(clave, nombre, resultado)
+
+    def _reintentar(self, clave, nombre, datos, medir):
+        self._finalizar(clave, nombre, extraer_aislado(0, nombre, datos, self.cache, medir))
+
+    def _finalizar(self, clave, nombre, resultado):
+        (_, _, _, error), contadores, tiempos = resultado
+        if contadores:
+            CONTADORES.update(contadores)
+            metricas.combinar(tiempos)
+        self._actualizar(clave, nombre, LISTO if error is None else ERROR, error)
+        with self._lock:
+            self._en_curso.discard(clave)
+
+    def estados(self, claves):
+        # Devuelve {clave: (estado, error)} de las claves registradas
+        claves = list(claves)
+        estados = {}
+        with self._conectar() as conn:
+            # SQLite limita la cantidad de parámetros por consulta
+            for i in range(0, len(claves), 500):
+                parte = claves[i:i + 500]
+                filas = conn.execute(
+                    f"SELECT clave, estado, error FROM trabajos WHERE clave IN ({','.join('?' * len(parte))})",
+                    parte
+                )
+                estados.update({clave: (estado, error) for clave, estado, error in filas})
+        return estados
+
+    def resultado(self, clave):
+        # Extracción de un trabajo listo, o None si todavía no está (o salió de la caché)
+        return self.cache.obtener(clave)
+
+    def cerrar(self):
+        self._aislados.shutdown(wait=False, cancel_futures=True)
+        self.trabajadores.cerrar(esperar=False)
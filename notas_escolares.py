@@ -1,37 +1,48 @@
 
 import os
 import io
-import tempfile
+import time
 import pandas as pd
 import streamlit as st
 import base64
-from notas import procesar_pdf, escolar_o_egresado, calcular_promedios, cumple_excepcion, evaluar_periodos, procesar
+from notas import ColaTrabajos, Almacen, GrafoResultados, Deduplicador, CONTADORES, REGLAS, metricas
+from notas.cache import hash_pdf
+from notas.trabajos import LISTO, ESPERA, ERROR
+from notas.exportar import hojas_de, exportar_excel, exportar_zip
+from notas.compacto import expandir
 from streamlit_option_menu import option_menu
 
-# Especificar la ruta de Ghostscript
+# Especificar la ruta de Ghostscript (una sola vez: el script se vuelve a ejecutar en cada recarga)
 if os.name == 'nt':  # Si es Windows
-    os.environ["PATH"] += os.pathsep + r'C:\Program Files\gs\gs10.03.1\bin'
+    ruta_gs = r'C:\Program Files\gs\gs10.03.1\bin'
 else:  # Si es otro sistema operativo (por ejemplo, Linux)
-    os.environ["PATH"] += os.pathsep + r'/usr/bin'
-
-# Crear un directorio temporal
-TEMP = tempfile.TemporaryDirectory()
+    ruta_gs = r'/usr/bin'
+if ruta_gs not in os.environ["PATH"].split(os.pathsep):
+    os.environ["PATH"] += os.pathsep + ruta_gs
 
 # Configurar la página y el fondo
 st.set_page_config(initial_sidebar_state='collapsed', page_title="Sistema de Evaluación de Notas - UPCH", page_icon=":mortar_board:")
 
-# Función para convertir la imagen en base64 y usarla como fondo
-def get_base64_of_bin_file(bin_file):
-    with open(bin_file, 'rb') as f:
-        data = f.read()
-    return base64.b64encode(data).decode()
+# Función para convertir la imagen en base64 y usarla como fondo. Se calcula una vez por
+# proceso y no en cada recarga; con ancho_max la imagen se reduce y se pasa a JPEG
+@st.cache_resource
+def get_base64_of_bin_file(bin_file, ancho_max=None):
+    if ancho_max is None:
+        with open(bin_file, 'rb') as f:
+            return 'image/png', base64.b64encode(f.read()).decode()
+    from PIL import Image
+    imagen = Image.open(bin_file).convert('RGB')
+    imagen.thumbnail((ancho_max, ancho_max))
+    buffer = io.BytesIO()
+    imagen.save(buffer, 'JPEG', quality=75, optimize=True, progressive=True)
+    return 'image/jpeg', base64.b64encode(buffer.getvalue()).decode()
 
 def set_background(image_file):
-    bin_str = get_base64_of_bin_file(image_file)
+    mime, bin_str = get_base64_of_bin_file(image_file, ancho_max=1600)
     page_bg_img = f"""
     <style>
     .stApp {{
-    background-image: url("data:image/png;base64,{bin_str}");
+    background-image: url("data:{mime};base64,{bin_str}");
     background-size: cover;
     background-position: top left;
     background-repeat: no-repeat;
@@ -44,33 +55,148 @@ def set_background(image_file):
 # Llamar la función para establecer la imagen de fondo
 set_background('img.png') 
 
-@st.cache_data(persist="disk", show_spinner="Procesando ⏳")
-def procesar_archivo(file, minADA, carrera):
-    global TEMP
-    dni, nombre, documento, df, grado_maximo = procesar_pdf(file, pwd=TEMP.name)
-    #print(f"Grado máximo en procesar_archivo: {grado_maximo}")  # Imprimir grado máximo para depuración
-    if isinstance(dni, str) and "No cumple con el requisito" in dni:
-        return dni, None, None, None, None, None
-    tipo = escolar_o_egresado(df)
-    prom1a4, prom1a5, notaR = calcular_promedios(df)
-    cumple, counts = cumple_excepcion(df, minADA)
-    es_letras = df['NOTA'].apply(lambda x: not (isinstance(x, (int, float)) or str(x).isdigit())).any()
-    periodos_resultados = evaluar_periodos(df, carrera, es_letras, grado_maximo)
-    periodos_resultados['DNI'] = dni
-    result = pd.Series({
-        'DNI': dni,
-        'Nombre': nombre,
-        'Excepcion': cumple,
-        'Prom1a4': prom1a4,
-        'Prom1a5': prom1a5,
-        'Tipo': tipo,
-        'Documento': documento,
-        'MinADyA': minADA,
-    })
-    notas = counts.drop(columns='DNI').set_index('NOTA')['Cantidad'].rename(0)
-    result = pd.concat([result, notas], axis=0)
-    result = result.reindex(['DNI', 'Nombre', 'Tipo', 'Excepcion', 'Prom1a4', 'Prom1a5', 'AD', 'A', 'B', 'C', 'Documento', 'MinADyA'])
-    return result, df, counts, notaR, periodos_resultados, es_letras
+# Una sola cola (y un solo pool de procesos) compartida por todas las sesiones
+@st.cache_resource
+def obtener_cola():
+    return ColaTrabajos()
+
+@st.cache_resource
+def obtener_almacen():
+    return Almacen()
+
+# Las copias de un certificado ya cargado no se procesan: solo el primero de cada grupo. Otro
+# escaneo del mismo certificado espera a que termine el original y se procesa si el original
+# falló, como en el lote. Devuelve los archivos a procesar y cuántos siguen esperando
+def revisar_duplicados(files, dedup):
+    hashes = st.session_state.setdefault('hashes', {})
+    por_clave = {}
+    for f in files:
+        if f.file_id not in hashes:
+            hashes[f.file_id] = hash_pdf(f.getvalue())
+        por_clave.setdefault(hashes[f.file_id], f)
+    # Lo que ya se sabe de cada original, de las ejecuciones anteriores de la página
+    evaluacion = st.session_state.get('evaluacion')
+    salidas = evaluacion['salidas'] if evaluacion else {}
+    unicos = []
+    revisar = [(f.name, f.getvalue(), hashes[f.file_id]) for f in files]
+    while revisar:
+        nuevos = [clave for nombre, datos, clave in revisar if dedup.revisar(nombre, datos, clave) is not None]
+        unicos.extend(por_clave[clave] for clave in nuevos)
+        revisar = []
+        for clave in nuevos:
+            huella = dedup.huellas.get(clave)
+            if huella in dedup.retenidos and clave in salidas:
+                _, mensaje, error = salidas[clave]
+                revisar.extend(dedup.resolver(huella, mensaje is None and error is None))
+    return unicos, sum(len(retenidos) for retenidos in dedup.retenidos.values())
+
+# Encola los archivos nuevos y agrega a los resultados los que ya terminaron, sin esperar
+# a los demás. Devuelve los resultados, (nombre, mensaje, error) por archivo, cuántos
+# siguen pendientes y el reporte de duplicados. Los rasgos de cada estudiante se calculan una sola vez: al cambiar
+# minADA o la carrera, GrafoResultados solo recalcula la decisión final
+def procesar_archivos(files, minADA, carrera):
+    cola = obtener_cola()
+    dedup = Deduplicador(st.session_state.setdefault('huellas', {}), esperar_original=True)
+    files, retenidos = revisar_duplicados(files, dedup)
+    claves = st.session_state.setdefault('claves', {})
+    for f in files:
+        if f.file_id not in claves:
+            # Un archivo recién cargado se procesa aunque haya fallado antes (en otra sesión o carga)
+            claves[f.file_id] = cola.encolar(f.name, f.getvalue(), reintentar=True)
+    actuales = {claves[f.file_id] for f in files}
+    evaluacion = st.session_state.get('evaluacion')
+    if evaluacion is None or not set(evaluacion['salidas']) <= actuales:
+        # Primera carga o se quitó algún archivo: se arma de nuevo con lo que está en la caché
+        evaluacion = st.session_state['evaluacion'] = {'resultados': GrafoResultados(minADA, carrera), 'salidas': {}}
+    resultados, salidas = evaluacion['resultados'], evaluacion['salidas']
+    resultados.fijar(minADA=minADA, carrera=carrera)
+    guardadas = evaluacion.setdefault('guardadas', set())
+    if evaluacion.get('parametros', (minADA, carrera)) != (minADA, carrera):
+        # Lo guardado debe coincidir con lo que se muestra: las consultas por DNI y /results
+        # devuelven la decisión con el último minADA y la última carrera elegidos
+        obtener_almacen().guardar_decisiones(
+            (decision for decision in resultados.decisiones() if decision[0] in guardadas), carrera
+        )
+    evaluacion['parametros'] = (minADA, carrera)
+    estados = cola.estados(actuales)
+    pendientes = retenidos
+    for f in files:
+        clave = claves[f.file_id]
+        estado, error = estados.get(clave, (None, None))
+        if clave in salidas:
+            continue
+        if estado == ERROR:
+            salidas[clave] = (f.name, None, error)
+            continue
+        extraccion = cola.resultado(clave) if estado == LISTO else None
+        if extraccion is None:
+            if estado in (LISTO, ESPERA):
+                # Terminó pero ya no está en la caché, o esperaba lugar en el pool: se vuelve a encolar
+                cola.encolar(f.name, f.getvalue())
+            pendientes += 1
+            continue
+        try:
+            salida = resultados.agregar(extraccion, clave)
+        except Exception as e:
+            salidas[clave] = (f.name, None, str(e))
+            continue
+        if isinstance(salida[0], str):
+            salidas[clave] = (f.name, salida[0], None)
+        else:
+            salidas[clave] = (f.name, None, None)
+            obtener_almacen().guardar(clave, salida, carrera)
+            guardadas.add(clave)
+    return resultados, list(salidas.values()), pendientes, dedup.reporte()
+
+# Consulta de postulantes evaluados anteriormente, sin volver a cargar el archivo
+def consultar_dni():
+    with st.expander("Consultar un DNI evaluado anteriormente"):
+        dni = st.text_input("DNI o código de estudiante:").strip()
+        if not dni:
+            return
+        consulta = obtener_almacen().consultar_dni(dni)
+        if consulta['results'].empty:
+            st.info("No hay evaluaciones guardadas para ese DNI")
+            return
+        st.dataframe(consulta['results'].set_index('DNI'), use_container_width=True)
+        st.dataframe(consulta['periodos'].drop(columns='DNI').dropna(axis=1, how='all'), use_container_width=True)
+
+FORMATOS = {
+    'Excel (.xlsx)': ('Resultado.xlsx', 'application/vnd.ms-excel'),
+    'Parquet (.zip)': ('Resultado-parquet.zip', 'application/zip'),
+    'CSV comprimido (.zip)': ('Resultado-csv.zip', 'application/zip'),
+}
+
+# El archivo de descarga se genera solo cuando se pide, no en cada ejecución de la página
+def descargar(resultados):
+    formato = st.selectbox("Formato de descarga:", options=list(FORMATOS))
+    firma = (formato, len(resultados), resultados.minADA, resultados.carrera)
+    if st.button("Preparar descarga"):
+        buffer = io.BytesIO()
+        hojas = hojas_de(resultados)
+        if formato.startswith('Excel'):
+            exportar_excel(hojas, buffer)
+        else:
+            exportar_zip(hojas, buffer, 'parquet' if formato.startswith('Parquet') else 'csv')
+        st.session_state['descarga'] = (firma, buffer.getvalue())
+    descarga = st.session_state.get('descarga')
+    if descarga and descarga[0] == firma:
+        nombre, mime = FORMATOS[formato]
+        st.download_button("Descargar", data=descarga[1], file_name=nombre, mime=mime)
+
+# Pestaña de diagnóstico oculta: se muestra con ?diagnostico=1 en la URL o NOTAS_DIAGNOSTICO=1
+def modo_diagnostico():
+    return st.query_params.get('diagnostico') == '1' or os.environ.get('NOTAS_DIAGNOSTICO') == '1'
+
+def mostrar_diagnostico():
+    tiempos = pd.DataFrame(metricas.resumen())
+    if tiempos.empty:
+        st.write("Aún no hay tiempos registrados")
+    else:
+        st.dataframe(tiempos.set_index('etapa').round(3), use_container_width=True)
+    if CONTADORES:
+        st.dataframe(pd.Series(CONTADORES, name='Cantidad').to_frame(), use_container_width=True)
+    st.download_button("Descargar métricas", data=metricas.a_prometheus(CONTADORES), file_name="metricas.txt", mime="text/plain")
 
 def main():    
     # Obtener la ruta del directorio actual
@@ -80,8 +206,7 @@ def main():
     logo_path = os.path.join(current_dir, "logo-upch.png")
     
     # Cargar el logo y convertir a base64
-    with open(logo_path, "rb") as image_file:
-        encoded_logo = base64.b64encode(image_file.read()).decode()
+    _, encoded_logo = get_base64_of_bin_file(logo_path)
     
     # Usar HTML para título y logo
     st.markdown(f"""
@@ -147,74 +272,57 @@ def main():
         """, unsafe_allow_html=True)
     
     with st.sidebar:
-        minADA = 72
-        min = st.select_slider(
+        minADA = st.select_slider(
             'Cantidad mínima de AD y A para aprobar:',
             options=range(1, 89),
-            value=72,
-            help='Cambiar el valor reprocesará todos los archivos actualmente cargados, se recomienda hacerlo antes de la carga de archivos'
+            value=REGLAS.minimo_ad_a,
+            help='El cambio se aplica al instante a todos los archivos cargados'
         )
-        btn = st.button("Aplicar")
-        if btn:
-            minADA = min
     # Selección de carrera utilizando streamlit_option_menu
     carrera = option_menu(
         menu_title="Selecciona la carrera",
-        options=["MEDICINA", "Todas las carreras, excepto MEDICINA"],
-        icons=["activity", "book"],
+        # Una opción por modalidad de reglas.toml
+        options=list(REGLAS.modalidades.index),
+        icons=["activity" if m == "MEDICINA" else "book" for m in REGLAS.modalidades.index],
         menu_icon="cast",
         default_index=0,
         orientation="vertical"
     )
     
+    consultar_dni()
+
     # Carga de archivos
     files = st.file_uploader('Adjunta tu Certificado de Estudios COE o CLA', accept_multiple_files=True, type=['pdf'])
     if not files:
         return
-    progress_bar = st.progress(0, text="Procesando archivos...")
-    results = pd.DataFrame()  # resultados finales
-    resultsData = pd.DataFrame()  # Tidy data
-    resultsCount = pd.DataFrame()  # Cantidad de notas
-    resultsR = pd.DataFrame()  # Promedios por áreas
-    resultsColegios = pd.DataFrame()  # Colegios por grados
-    errores = pd.DataFrame()
-    n = len(files)
-    last_result = None  # Variable para almacenar el resultado del último archivo procesado
-    last_dni = None  # Variable para almacenar el DNI del último archivo procesado
-    for i, file in enumerate(files):
-        progress_bar.progress((i + 1) / n, f"Procesando archivo {i + 1}...")
-        try:
-            result, data, count, notaR, periodos, es_letras = procesar_archivo(file, minADA, carrera)
-            if isinstance(result, str):
-                st.error(result)
-                continue
-            results = pd.concat([results, result.to_frame().T], axis=0, ignore_index=True)
-            resultsData = pd.concat([resultsData, data], axis=0, ignore_index=True)
-            resultsCount = pd.concat([resultsCount, count], axis=0, ignore_index=True)
-            resultsR = pd.concat([resultsR, notaR], axis=0, ignore_index=True)
-            resultsColegios = pd.concat([resultsColegios, periodos], axis=0, ignore_index=True)
-            last_result = periodos  # Actualizar el último resultado
-            last_dni = result['DNI']  # Actualizar el último DNI
-        except Exception as e:
-            errores = pd.concat(
-                [errores, pd.DataFrame([[file.name, str(e)]], columns=['Archivo', 'Error'])],
-                ignore_index=True
-            )
-            continue
-
-    progress_bar.empty()
+    diagnostico = modo_diagnostico()
+    # Con ?diagnostico=1 se mide solo lo que procesa esta sesión, no la de los demás usuarios
+    with metricas.midiendo(diagnostico):
+        resultados, salidas, pendientes, duplicados = procesar_archivos(files, minADA, carrera)
+    if pendientes:
+        listos = len(files) - pendientes
+        st.progress(listos / len(files), text=f"Procesando archivos: {listos} de {len(files)} listos...")
+    # resultados: resultados finales, tidy data, cantidades, promedios por áreas y periodos
+    errores = pd.DataFrame(
+        [(nombre, error) for nombre, _, error in salidas if error is not None],
+        columns=['Archivo', 'Error']
+    )
+    for _, mensaje, _ in salidas:
+        if mensaje is not None:
+            st.error(mensaje)
     
-    res, cal, tab, err = st.tabs(['Resultados', 'Cálculos', 'Tablas', 'Errores'])
-    if not results.empty:
-        results = results.set_index('DNI')
-        resultsData['NOTA'] = resultsData['NOTA'].map(lambda x: float(x) if str(x).isdigit() else x)
+    res, cal, tab, err, *diag = st.tabs(['Resultados', 'Cálculos', 'Tablas', 'Errores'] + (['Diagnóstico'] if diagnostico else []))
+    if len(resultados):
+        results = resultados.results.set_index('DNI')
+        last_dni = resultados.ultimo_dni  # DNI del último archivo procesado
         with res:
             dni_options = results.index.unique().tolist()
             dni = st.selectbox("Filtrar DNI:", options=dni_options, index=dni_options.index(last_dni) if last_dni in dni_options else 0)
             st.write("Resultados por Periodo:")
-            periodos_filtrados = resultsColegios[resultsColegios['DNI'] == dni]
+            periodos_filtrados = resultados.por_dni('periodos', dni)
             if not periodos_filtrados.empty:
-                st.dataframe(periodos_filtrados.drop(columns='DNI').reset_index(drop=True))
+                # Solo la medida que corresponde al estudiante (promedio o porcentaje de AD y A)
+                st.dataframe(periodos_filtrados.drop(columns='DNI').dropna(axis=1, how='all').reset_index(drop=True))
                 
                 # Verificar si el estudiante aplica o no
                 aplica = (periodos_filtrados['ESTADO'] == 'CUMPLE').any()
@@ -224,23 +332,20 @@ def main():
                     st.error("El estudiante NO APLICA para esta modalidad de admisión.")
             else:
                 st.write("No hay resultados para mostrar.")
-            buffer = io.BytesIO()
-            with pd.ExcelWriter(buffer) as writer:
-                results.to_excel(writer)
-            st.download_button("Descargar", data=buffer, file_name="Resultado.xlsx", mime="application/vnd.ms-excel")
+            descargar(resultados)
         with cal:
-            if 'GRADO' in resultsColegios.columns:
-                st.dataframe(resultsColegios.query(f'DNI == "{dni}"').drop(columns='DNI').set_index('GRADO'))
-            if 'NOTA' in resultsCount.columns:
-                st.dataframe(resultsCount.query(f'DNI == "{dni}"').drop(columns='DNI').set_index('NOTA').T)
-            prom = resultsR.query(f'DNI == "{dni}"').pivot(index=['DESC'], columns='GRADO', values='NOTA')
+            if 'NOTA' in resultados.counts.columns:
+                st.dataframe(resultados.por_dni('counts', dni).drop(columns='DNI').set_index('NOTA').T)
+            prom = resultados.por_dni('promedios', dni).pivot(index=['DESC'], columns='GRADO', values='NOTA')
             st.dataframe(pd.concat([
                 prom,
                 prom.mean().rename('**PROMEDIO**').to_frame().T,
                 prom.count().rename('**CANTIDAD**').to_frame().T
             ]).round(2), use_container_width=True)
         with tab:
-            d = resultsData.query(f'DNI == "{dni}"').drop(columns='DNI')
+            d = expandir(resultados.por_dni('data', dni)).drop(columns='DNI')
+            numeros = pd.to_numeric(d['NOTA'], errors='coerce')
+            d['NOTA'] = numeros.where(numeros.notna(), d['NOTA'])
             st.dataframe(
                 d[d['COMP'].isnull()].pivot(
                     index=['DESC'], columns='GRADO', values='NOTA'
@@ -253,6 +358,10 @@ def main():
                 ),
                 use_container_width=True
             )
+    if not duplicados.empty:
+        with err:
+            st.write("Archivos duplicados (no se procesaron):")
+            st.dataframe(duplicados, use_container_width=True)
     if errores.empty:
         with err:
             st.write("No se encontraron errores")
@@ -261,6 +370,14 @@ def main():
             st.dataframe(errores, use_container_width=True)
         with res:
             st.error(f'Hay {errores.shape[0]} archivo(s) con error!')
+    if diag:
+        with diag[0]:
+            mostrar_diagnostico()
+    if pendientes:
+        # Se vuelve a ejecutar la página para mostrar los archivos a medida que terminan;
+        # cualquier interacción del usuario interrumpe la espera
+        time.sleep(1)
+        st.rerun()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file